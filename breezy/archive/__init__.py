@@ -30,6 +30,35 @@ from .. import (
     )
 
 
+class ChunkWriter:
+    """A write-only file collecting the chunks written to it.
+
+    This allows archivers writing to a file object to be used as generators
+    of chunks, without buffering the whole archive.
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._pos = 0
+
+    def write(self, data):
+        self._chunks.append(data)
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._pos
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        """Return the data written since the last call."""
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
 class ArchiveFormatInfo:
 
     def __init__(self, extensions):
@@ -64,17 +93,32 @@ class ArchiveFormatRegistry(registry.Registry):
         for ext in extensions:
             self._extension_map[ext] = name
 
+    def get_extension(self, filename):
+        """Find the registered extension that filename ends with.
+
+        Every suffix of the base name starting at a '.' is looked up in the
+        extension map, longest first, so compound extensions like '.tar.gz'
+        are preferred.
+
+        :param filename: Filename to guess from
+        :return: The matching extension, or None
+        """
+        basename = filename.rsplit('/', 1)[-1]
+        start = basename.find('.')
+        while start != -1:
+            suffix = basename[start:]
+            if suffix in self._extension_map:
+                return suffix
+            start = basename.find('.', start + 1)
+        return None
+
     def get_format_from_filename(self, filename):
         """Determine the archive format from an extension.
 
         :param filename: Filename to guess from
         :return: A format name, or None
         """
-        for ext, format in self._extension_map.items():
-            if filename.endswith(ext):
-                return format
-        else:
-            return None
+        return self._extension_map.get(self.get_extension(filename))
 
 
 def create_archive(format, tree, name, root=None, subdir=None,
@@ -26,10 +26,12 @@ from .. import (
     errors,
     osutils,
     )
-from ..export import _export_iter_entries
+from . import ChunkWriter
+from ..export import _export_iter_contents, _export_iter_entries
 
 
-def prepare_tarball_item(tree, root, final_path, tree_path, entry, force_mtime=None):
+def prepare_tarball_item(tree, root, final_path, tree_path, entry, force_mtime=None,
+                         content=None):
     """Prepare a tarball item for exporting
 
     :param tree: Tree to export
@@ -38,6 +40,7 @@ def prepare_tarball_item(tree, root, final_path, tree_path, entry, force_mtime=N
     :param entry: Entry to export
     :param force_mtime: Option mtime to force, instead of using tree
         timestamps.
+    :param content: The text of the file if already known.
 
     Returns a (tarinfo, fileobj) tuple
     """
@@ -57,7 +60,8 @@ def prepare_tarball_item(tree, root, final_path, tree_path, entry, force_mtime=N
         # the tarfile contract, which wants the size of the file up front.  We
         # want to make sure it doesn't change, and we need to read it in one
         # go for content filtering.
-        content = tree.get_file_text(tree_path)
+        if content is None:
+            content = tree.get_file_text(tree_path)
         item.size = len(content)
         fileobj = BytesIO(content)
     elif entry.kind in ("directory", "tree-reference"):
@@ -88,18 +92,22 @@ def tarball_generator(tree, root, subdir=None, force_mtime=None, format='', recu
         timestamps.
     Returns: A generator that will produce file content chunks.
     """
-    buf = BytesIO()
+    if force_mtime is not None:
+        # tar headers only store whole seconds
+        force_mtime = int(force_mtime)
+    buf = ChunkWriter()
     with closing(tarfile.open(None, "w:%s" % format, buf)) as ball, tree.lock_read():
-        for final_path, tree_path, entry in _export_iter_entries(
-                tree, subdir, recurse_nested=recurse_nested):
+        entries = _export_iter_entries(
+            tree, subdir, recurse_nested=recurse_nested)
+        for final_path, tree_path, entry, content in _export_iter_contents(
+                tree, entries):
             (item, fileobj) = prepare_tarball_item(
-                tree, root, final_path, tree_path, entry, force_mtime)
+                tree, root, final_path, tree_path, entry, force_mtime,
+                content)
             ball.addfile(item, fileobj)
             # Yield the data that was written so far, rinse, repeat.
-            yield buf.getvalue()
-            buf.truncate(0)
-            buf.seek(0)
-    yield buf.getvalue()
+            yield buf.pop()
+    yield buf.pop()
 
 
 def tgz_generator(tree, dest, root, subdir, force_mtime=None, recurse_nested=False):
@@ -128,7 +136,7 @@ def tgz_generator(tree, dest, root, subdir, force_mtime=None, recurse_nested=Fal
         # the basename can be stored in the gzip file rather than
         # dest. (bug 102234)
         basename = os.path.basename(dest)
-        buf = BytesIO()
+        buf = ChunkWriter()
         zipstream = gzip.GzipFile(basename, 'w', fileobj=buf,
                                   mtime=root_mtime)
         for chunk in tarball_generator(
@@ -136,12 +144,10 @@ def tgz_generator(tree, dest, root, subdir, force_mtime=None, recurse_nested=Fal
                 recurse_nested=recurse_nested):
             zipstream.write(chunk)
             # Yield the data that was written so far, rinse, repeat.
-            yield buf.getvalue()
-            buf.truncate(0)
-            buf.seek(0)
+            yield buf.pop()
         # Closing zipstream may trigger writes to stream
         zipstream.close()
-        yield buf.getvalue()
+        yield buf.pop()
 
 
 def tbz_generator(tree, dest, root, subdir, force_mtime=None, recurse_nested=False):
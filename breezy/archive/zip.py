@@ -21,14 +21,14 @@ from contextlib import closing
 import os
 import stat
 import sys
-import tempfile
 import time
 import zipfile
 
 from .. import (
     osutils,
     )
-from ..export import _export_iter_entries
+from . import ChunkWriter
+from ..export import _export_iter_contents, _export_iter_entries
 from ..trace import mutter
 
 
@@ -50,47 +50,50 @@ def zip_archive_generator(tree, dest, root, subdir=None,
     already exists, it will be overwritten".
     """
     compression = zipfile.ZIP_DEFLATED
-    with tempfile.SpooledTemporaryFile() as buf:
-        with closing(zipfile.ZipFile(buf, "w", compression)) as zipf, \
-                tree.lock_read():
-            for dp, tp, ie in _export_iter_entries(
-                    tree, subdir, recurse_nested=recurse_nested):
-                mutter("  export {%s} kind %s to %s", tp, ie.kind, dest)
+    if force_mtime is not None:
+        # zip headers only store whole seconds, all entries get the same
+        # date and time
+        date_time = time.localtime(int(force_mtime))[:6]
+    # The writer is not seekable, so zipfile stores the size of the entries
+    # after their data rather than in their headers, which allows the
+    # archive to be streamed instead of being buffered as a whole.
+    buf = ChunkWriter()
+    with closing(zipfile.ZipFile(buf, "w", compression)) as zipf, \
+            tree.lock_read():
+        entries = _export_iter_entries(
+            tree, subdir, recurse_nested=recurse_nested)
+        for dp, tp, ie, content in _export_iter_contents(tree, entries):
+            mutter("  export {%s} kind %s to %s", tp, ie.kind, dest)
 
-                # zipfile.ZipFile switches all paths to forward
-                # slashes anyway, so just stick with that.
-                if force_mtime is not None:
-                    mtime = force_mtime
-                else:
-                    mtime = tree.get_file_mtime(tp)
-                date_time = time.localtime(mtime)[:6]
-                filename = osutils.pathjoin(root, dp)
-                if ie.kind == "file":
-                    zinfo = zipfile.ZipInfo(
-                        filename=filename,
-                        date_time=date_time)
-                    zinfo.compress_type = compression
-                    zinfo.external_attr = _FILE_ATTR
-                    content = tree.get_file_text(tp)
-                    zipf.writestr(zinfo, content)
-                elif ie.kind in ("directory", "tree-reference"):
-                    # Directories must contain a trailing slash, to indicate
-                    # to the zip routine that they are really directories and
-                    # not just empty files.
-                    zinfo = zipfile.ZipInfo(
-                        filename=filename + '/',
-                        date_time=date_time)
-                    zinfo.compress_type = compression
-                    zinfo.external_attr = _DIR_ATTR
-                    zipf.writestr(zinfo, '')
-                elif ie.kind == "symlink":
-                    zinfo = zipfile.ZipInfo(
-                        filename=(filename + '.lnk'),
-                        date_time=date_time)
-                    zinfo.compress_type = compression
-                    zinfo.external_attr = _FILE_ATTR
-                    zipf.writestr(zinfo, tree.get_symlink_target(tp))
-        # Urgh, headers are written last since they include e.g. file size.
-        # So we have to buffer it all :(
-        buf.seek(0)
-        yield from osutils.file_iterator(buf)
+            # zipfile.ZipFile switches all paths to forward
+            # slashes anyway, so just stick with that.
+            if force_mtime is None:
+                date_time = time.localtime(tree.get_file_mtime(tp))[:6]
+            filename = osutils.pathjoin(root, dp)
+            if ie.kind == "file":
+                zinfo = zipfile.ZipInfo(
+                    filename=filename,
+                    date_time=date_time)
+                zinfo.compress_type = compression
+                zinfo.external_attr = _FILE_ATTR
+                zipf.writestr(zinfo, content)
+            elif ie.kind in ("directory", "tree-reference"):
+                # Directories must contain a trailing slash, to indicate
+                # to the zip routine that they are really directories and
+                # not just empty files.
+                zinfo = zipfile.ZipInfo(
+                    filename=filename + '/',
+                    date_time=date_time)
+                zinfo.compress_type = compression
+                zinfo.external_attr = _DIR_ATTR
+                zipf.writestr(zinfo, '')
+            elif ie.kind == "symlink":
+                zinfo = zipfile.ZipInfo(
+                    filename=(filename + '.lnk'),
+                    date_time=date_time)
+                zinfo.compress_type = compression
+                zinfo.external_attr = _FILE_ATTR
+                zipf.writestr(zinfo, tree.get_symlink_target(tp))
+            # Yield the data that was written so far, rinse, repeat.
+            yield buf.pop()
+    yield buf.pop()
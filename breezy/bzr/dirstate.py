@@ -1940,7 +1940,7 @@ class DirState:
     def _sha1_file_and_mutter(self, abspath):
         # when -Dhashcache is turned on, this is monkey-patched in to log
         # file reads
-        trace.mutter("dirstate sha1 " + abspath)
+        trace.mutter("dirstate sha1 %s", abspath)
         return self._sha1_provider.sha1(abspath)
 
     def _is_executable(self, mode, old_executable):
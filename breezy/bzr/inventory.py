@@ -950,6 +950,55 @@ class CommonInventory:
             return None
         return ie.file_id
 
+    def paths2ids(self, paths):
+        """Look up the file ids of several paths.
+
+        The directories containing the paths are only resolved once, rather
+        than walking down from the root for every path.
+
+        :param paths: Iterable of paths, as strings with / as separators.
+        :return: dict mapping each path to its file id, or to None if the
+            path is not found.
+        """
+        result = {}
+        parents = {}
+        for path in paths:
+            names = osutils.splitpath(path)
+            if not names:
+                ie = self.get_entry_by_path(names)
+            else:
+                parent_path = '/'.join(names[:-1])
+                try:
+                    parent = parents[parent_path]
+                except KeyError:
+                    parent = parents[parent_path] = self.get_entry_by_path(
+                        names[:-1])
+                children = getattr(parent, 'children', None)
+                if children is None:
+                    ie = None
+                else:
+                    ie = children.get(names[-1])
+            if ie is None:
+                result[path] = None
+            else:
+                result[path] = ie.file_id
+        return result
+
+    def get_entries(self, file_ids):
+        """Look up the entries of several file ids.
+
+        :param file_ids: Iterable of file ids.
+        :return: dict mapping file ids to their entries. File ids that are
+            not in the inventory are omitted.
+        """
+        result = {}
+        for file_id in file_ids:
+            try:
+                result[file_id] = self.get_entry(file_id)
+            except errors.NoSuchId:
+                pass
+        return result
+
     def filter(self, specific_fileids):
         """Get an inventory view filtered against a set of file-ids.
 
@@ -1334,6 +1383,12 @@ class Inventory(CommonInventory):
             yield ie
             file_id = ie.parent_id
 
+    def get_entries(self, file_ids):
+        """See CommonInventory.get_entries."""
+        byid = self._byid
+        return {file_id: byid[file_id] for file_id in file_ids
+                if file_id in byid}
+
     def has_id(self, file_id):
         return (file_id in self._byid)
 
@@ -1983,6 +2038,10 @@ class CHKInventory(CommonInventory):
             self._fileid_to_entry_cache[entry.file_id] = entry
         return result
 
+    def get_entries(self, file_ids):
+        """See CommonInventory.get_entries."""
+        return {entry.file_id: entry for entry in self._getitems(file_ids)}
+
     def has_id(self, file_id):
         # Perhaps have an explicit 'contains' method on CHKMap ?
         if self._fileid_to_entry_cache.get(file_id, None) is not None:
@@ -19,8 +19,8 @@
 
 from collections import deque
 
+from operator import attrgetter
 import os
-import re
 from typing import Type, TYPE_CHECKING, Optional
 
 
@@ -148,18 +148,26 @@ class InventoryTree(Tree):
 
     supports_file_ids = True
 
-    def _unpack_file_id(self, file_id):
-        """Find the inventory and inventory file id for a tree file id.
+    def _root_file_id(self, file_id):
+        """Find the root inventory file id for a tree file id.
 
         :param file_id: The tree file id, as bytestring or tuple
-        :return: Inventory and inventory file id
+        :return: Inventory file id
         """
         if isinstance(file_id, tuple):
             if len(file_id) != 1:
                 raise ValueError(
-                    "nested trees not yet supported: %r" % file_id)
-            file_id = file_id[0]
-        return self.root_inventory, file_id
+                    "nested trees not yet supported: %r" % (file_id,))
+            return file_id[0]
+        return file_id
+
+    def _unpack_file_id(self, file_id):
+        """Find the inventory and inventory file id for a tree file id.
+
+        :param file_id: The tree file id, as bytestring or tuple
+        :return: Inventory and inventory file id
+        """
+        return self.root_inventory, self._root_file_id(file_id)
 
     def find_related_paths_across_trees(self, paths, trees=[],
                                         require_versioned=True):
@@ -211,12 +219,27 @@ class InventoryTree(Tree):
     def path2id(self, path):
         """Return the id for path in this tree."""
         with self.lock_read():
-            return self._path2inv_file_id(path)[1]
+            ie = self._path2inv_ie(path)[1]
+            if ie is None:
+                return None
+            return ie.file_id
 
 
     def is_versioned(self, path):
         return self.path2id(path) is not None
 
+    def filter_unversioned_files(self, paths):
+        """Filter out paths that are versioned.
+
+        :return: set of paths.
+        """
+        if self.supports_tree_reference():
+            # Paths may be versioned in nested trees.
+            return super().filter_unversioned_files(paths)
+        with self.lock_read():
+            file_ids = self.root_inventory.paths2ids(paths)
+        return {path for path, file_id in file_ids.items() if file_id is None}
+
     def _path2ie(self, path):
         """Lookup an inventory entry by path.
 
@@ -259,9 +282,9 @@ class InventoryTree(Tree):
 
         :raises NoSuchId:
         """
-        inventory, file_id = self._unpack_file_id(file_id)
+        file_id = self._root_file_id(file_id)
         try:
-            return inventory.id2path(file_id)
+            return self.root_inventory.id2path(file_id)
         except errors.NoSuchId:
             if recurse == 'down':
                 if 'evil' in debug.debug_flags:
@@ -276,7 +299,9 @@ class InventoryTree(Tree):
             raise errors.NoSuchId(self, file_id)
 
     def all_file_ids(self):
-        return {entry.file_id for path, entry in self.iter_entries_by_dir()}
+        with self.lock_read():
+            # No need to build the paths of the entries to get their ids
+            return set(self.root_inventory.iter_all_ids())
 
     def all_versioned_paths(self):
         return {path for path, entry in self.iter_entries_by_dir()}
@@ -324,6 +349,72 @@ class InventoryTree(Tree):
                 raise errors.NotADirectory(path)
             return ie.children.values()
 
+    def _get_canonical_inventory_path(self, path, normalize, resolved=None,
+                                      normalized_children=None):
+        """Find the canonical path of an item, ignoring case.
+
+        This is like breezy.tree.get_canonical_path, but looks up the
+        children of each directory entry directly rather than resolving
+        every intermediate path from the root again.
+
+        :param path: Case-insensitive path to look up
+        :param normalize: Function to normalize a filename for comparison
+        :param resolved: Optional dict caching the entries matched for the
+            leading elements of the paths, to share them between the lookups
+            of several paths.
+        :param normalized_children: Optional dict caching, by directory file
+            id, the children of the directories keyed by their normalized
+            name, so that each name is normalized only once across lookups.
+            It must be dropped when the inventory changes.
+        :return: The canonical path
+        """
+        cur_path = ''
+        cur_ie = self.root_inventory.root
+        prefix = ''
+        elts = path.split('/')
+        for i, elt in enumerate(elts):
+            if not elt:
+                continue
+            prefix += '/' + elt
+            if resolved is not None:
+                try:
+                    cur_path, cur_ie = resolved[prefix]
+                except KeyError:
+                    pass
+                else:
+                    continue
+            child = None
+            if cur_ie.kind == 'directory':
+                children = cur_ie.children
+                # An exact match always wins
+                child = children.get(elt)
+                if child is None:
+                    lelt = normalize(elt)
+                    if normalized_children is None:
+                        for name, ie in children.items():
+                            if normalize(name) == lelt:
+                                child = ie
+                    else:
+                        try:
+                            by_normalized = normalized_children[
+                                cur_ie.file_id]
+                        except KeyError:
+                            # The last match wins, as when scanning
+                            by_normalized = normalized_children[
+                                cur_ie.file_id] = {
+                                    normalize(name): ie
+                                    for name, ie in children.items()}
+                        child = by_normalized.get(lelt)
+            if child is None:
+                # No entries matched in this directory. Return what matched
+                # so far, plus the rest as specified.
+                return osutils.pathjoin(cur_path, *elts[i:])
+            cur_path = osutils.pathjoin(cur_path, child.name)
+            cur_ie = child
+            if resolved is not None:
+                resolved[prefix] = (cur_path, cur_ie)
+        return cur_path
+
     def _get_plan_merge_data(self, path, other, base):
         from . import versionedfile
         file_id = self.path2id(path)
@@ -714,6 +805,10 @@ class _SmartAddHelper:
             return entry[3]
         # Find a 'best fit' match if the filesystem is case-insensitive
         inv_path = self.tree._fix_case_of_inventory_path(inv_path)
+        if not self.tree.supports_tree_reference():
+            # Directories can't have become tree references, so the inventory
+            # entry can be used as is.
+            return self.tree.root_inventory.get_entry_by_path(inv_path)
         try:
             return next(self.tree.iter_entries_by_dir(
                 specific_files=[inv_path]))[1]
@@ -780,14 +875,18 @@ class _SmartAddHelper:
     def _gather_dirs_to_add(self, user_dirs):
         # only walk the minimal parents needed: we have user_dirs to override
         # ignores.
-        prev_dir = None
-
-        is_inside = osutils.is_inside_or_parent_of_any
+        prev_prefix = None
+        # As the paths are sorted and distinct, a path can be inside the
+        # previous one but can't be one of its parents.
         for path in sorted(user_dirs):
-            if (prev_dir is None or not is_inside([prev_dir], path)):
+            if prev_prefix is None or not path.startswith(prev_prefix):
                 inv_path, this_ie = user_dirs[path]
-                yield (path, inv_path, this_ie, None)
-            prev_dir = path
+                yield (path, inv_path, this_ie, None, None)
+            if path:
+                prev_prefix = path + '/'
+            else:
+                # The tree root contains everything
+                prev_prefix = ''
 
     def __init__(self, tree, action, conflicts_related=None):
         self.tree = tree
@@ -816,6 +915,7 @@ class _SmartAddHelper:
         if self.tree.supports_symlinks():
             file_list = list(map(osutils.normalizepath, file_list))
 
+        tree_abspath = self.tree.abspath
         user_dirs = {}
         # validate user file paths and convert all paths to tree
         # relative : it's cheaper to make a tree relative path an abspath
@@ -827,13 +927,17 @@ class _SmartAddHelper:
             if self.tree.is_control_filename(filepath):
                 raise errors.ForbiddenControlFileError(filename=filepath)
 
-            abspath = self.tree.abspath(filepath)
+            abspath = tree_abspath(filepath)
             kind = osutils.file_kind(abspath)
             # ensure the named path is added, so that ignore rules in the later
             # directory walk dont skip it.
             # we dont have a parent ie known yet.: use the relatively slower
             # inventory probing method
-            inv_path, _ = osutils.normalized_filename(filepath)
+            if filepath.isascii():
+                # ASCII names are already in NFC form.
+                inv_path = filepath
+            else:
+                inv_path, _ = osutils.normalized_filename(filepath)
             this_ie = self._get_ie(inv_path)
             if this_ie is None:
                 this_ie = self._add_one_and_parent(
@@ -846,12 +950,26 @@ class _SmartAddHelper:
             # no need to walk any directories at all.
             return
 
-        things_to_add = list(self._gather_dirs_to_add(user_dirs))
-
-        illegalpath_re = re.compile(r'[\r\n]')
-        for directory, inv_path, this_ie, parent_ie in things_to_add:
+        # Consume the work queue from the left so that processed entries are
+        # released as the walk goes on.
+        things_to_add = deque(self._gather_dirs_to_add(user_dirs))
+
+        # Only whether a control directory is found in a subdirectory
+        # matters, not which format finds it, so the probers are sorted once
+        # rather than for each subdirectory.
+        root_transport = _mod_transport.get_transport_from_path(
+            self.tree.basedir)
+        probers = sorted(
+            controldir.ControlDirFormat.all_probers(),
+            key=lambda prober: prober.priority(root_transport))
+        # There usually are no conflicts, so the set is mostly empty.
+        conflicts_related = self.conflicts_related
+        versionable_kind = _mod_inventory.InventoryEntry.versionable_kind
+        while things_to_add:
+            (directory, inv_path, this_ie, parent_ie,
+             dir_entry) = things_to_add.popleft()
             # directory is tree-relative
-            abspath = self.tree.abspath(directory)
+            abspath = tree_abspath(directory)
 
             # get the contents of this directory.
 
@@ -859,7 +977,14 @@ class _SmartAddHelper:
             # for reuse
             stat_value = None
             if this_ie is None:
-                stat_value = osutils.file_stat(abspath)
+                if dir_entry is None:
+                    stat_value = osutils.file_stat(abspath)
+                else:
+                    # Reuse what the OS told us while listing the parent
+                    # directory, this saves a stat on some platforms.
+                    stat_value = osutils.file_stat(
+                        abspath,
+                        lambda path: dir_entry.stat(follow_symlinks=False))
                 kind = osutils.file_kind_from_stat_mode(stat_value.st_mode)
             else:
                 kind = this_ie.kind
@@ -867,14 +992,14 @@ class _SmartAddHelper:
             # allow AddAction to skip this file
             if self.action.skip_file(self.tree, abspath, kind, stat_value):
                 continue
-            if not _mod_inventory.InventoryEntry.versionable_kind(kind):
+            if not versionable_kind(kind):
                 trace.warning("skipping %s (can't add file of kind '%s')",
                               abspath, kind)
                 continue
-            if illegalpath_re.search(directory):
+            if '\r' in directory or '\n' in directory:
                 trace.warning("skipping %r (contains \\n or \\r)" % abspath)
                 continue
-            if directory in self.conflicts_related:
+            if conflicts_related and directory in conflicts_related:
                 # If the file looks like one generated for a conflict, don't
                 # add it.
                 trace.warning(
@@ -885,7 +1010,8 @@ class _SmartAddHelper:
             if kind == 'directory' and directory != '':
                 try:
                     transport = _mod_transport.get_transport_from_path(abspath)
-                    controldir.ControlDirFormat.find_format(transport)
+                    controldir.ControlDirFormat.find_format(
+                        transport, probers=probers)
                     sub_tree = True
                 except errors.NotBranchError:
                     sub_tree = False
@@ -914,38 +1040,62 @@ class _SmartAddHelper:
                 if this_ie.kind != 'directory':
                     this_ie = self._convert_to_directory(this_ie, inv_path)
 
-                for subf in sorted(os.listdir(abspath)):
-                    inv_f, _ = osutils.normalized_filename(subf)
+                # The children are sorted so that they are added, and
+                # reported, in a stable order whatever the filesystem.
+                with os.scandir(abspath) as scanned:
+                    dir_entries = sorted(scanned, key=attrgetter('name'))
+                # Tree and inventory paths always use '/', so the children
+                # paths are built by plain concatenation.
+                if directory:
+                    dir_prefix = directory + '/'
+                else:
+                    dir_prefix = ''
+                if inv_path:
+                    inv_prefix = inv_path + '/'
+                else:
+                    inv_prefix = ''
+                invdelta_get = self._invdelta.get
+                children_get = this_ie.children.get
+                is_control_filename = self.tree.is_control_filename
+                at_root = not directory
+                is_ignored = self.tree.is_ignored
+                for sub_entry in dir_entries:
+                    subf = sub_entry.name
+                    if subf.isascii():
+                        # ASCII names are already in NFC form.
+                        inv_f = subf
+                    else:
+                        inv_f, _ = osutils.normalized_filename(subf)
                     # here we could use TreeDirectory rather than
                     # string concatenation.
-                    subp = osutils.pathjoin(directory, subf)
-                    # TODO: is_control_filename is very slow. Make it faster.
-                    # TreeDirectory.is_control_filename could also make this
-                    # faster - its impossible for a non root dir to have a
-                    # control file.
-                    if self.tree.is_control_filename(subp):
+                    subp = dir_prefix + subf
+                    # Control files only live in the root of the tree, so
+                    # is_control_filename (which is slow) is only asked about
+                    # the children of the root directory.
+                    if at_root and is_control_filename(subp):
                         trace.mutter("skip control directory %r", subp)
                         continue
-                    sub_invp = osutils.pathjoin(inv_path, inv_f)
-                    entry = self._invdelta.get(sub_invp)
+                    sub_invp = inv_prefix + inv_f
+                    entry = invdelta_get(sub_invp)
                     if entry is not None:
                         sub_ie = entry[3]
                     else:
-                        sub_ie = this_ie.children.get(inv_f)
+                        sub_ie = children_get(inv_f)
                     if sub_ie is not None:
                         # recurse into this already versioned subdir.
-                        things_to_add.append((subp, sub_invp, sub_ie, this_ie))
+                        things_to_add.append(
+                            (subp, sub_invp, sub_ie, this_ie, None))
                     else:
                         # user selection overrides ignores
                         # ignore while selecting files - if we globbed in the
                         # outer loop we would ignore user files.
-                        ignore_glob = self.tree.is_ignored(subp)
+                        ignore_glob = is_ignored(subp)
                         if ignore_glob is not None:
                             self.ignored.setdefault(
                                 ignore_glob, []).append(subp)
                         else:
                             things_to_add.append(
-                                (subp, sub_invp, None, this_ie))
+                                (subp, sub_invp, None, this_ie, sub_entry))
 
 
 class InventoryRevisionTree(RevisionTree, InventoryTree):
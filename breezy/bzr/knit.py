@@ -1041,8 +1041,13 @@ class KnitVersionedFiles(VersionedFilesWithFallbacks):
             # indexes can't directly store that, so we give them
             # an empty tuple instead.
             parents = ()
-        lines = content_factory.get_bytes_as('lines')
         line_bytes = content_factory.get_bytes_as('fulltext')
+        if content_factory.storage_kind == 'file':
+            # Split the text we already read rather than reading the file a
+            # second time.
+            lines = osutils.split_lines(line_bytes)
+        else:
+            lines = content_factory.get_bytes_as('lines')
         return self._add(key, lines, parents,
                          parent_texts, left_matching_blocks, nostore_sha, random_id,
                          line_bytes=line_bytes)
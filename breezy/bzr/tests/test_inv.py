@@ -1103,6 +1103,49 @@ class TestCHKInventory(tests.TestCaseWithMemoryTransport):
         self.assertEqual(b'dirid', new_inv.path2id('dir'))
         self.assertEqual(b'fileid', new_inv.path2id('dir/file'))
 
+    def test_paths2ids(self):
+        inv = Inventory()
+        inv.revision_id = b"revid"
+        inv.root.revision = b"rootrev"
+        inv.add(InventoryDirectory(b"dirid", "dir", inv.root.file_id))
+        inv.add(InventoryFile(b"fileid", "file", b"dirid"))
+        inv.get_entry(b"fileid").revision = b"filerev"
+        inv.get_entry(b"fileid").text_sha1 = b"ffff"
+        inv.get_entry(b"fileid").text_size = 1
+        inv.get_entry(b"dirid").revision = b"filerev"
+        chk_bytes = self.get_chk_bytes()
+        chk_inv = CHKInventory.from_inventory(chk_bytes, inv)
+        lines = chk_inv.to_lines()
+        new_inv = CHKInventory.deserialise(chk_bytes, lines, (b"revid",))
+        paths = ['', 'dir', 'dir/file', 'dir/other', 'dir/file/sub', 'nope/x']
+        expected = {
+            '': inv.root.file_id, 'dir': b'dirid', 'dir/file': b'fileid',
+            'dir/other': None, 'dir/file/sub': None, 'nope/x': None}
+        self.assertEqual(expected, inv.paths2ids(paths))
+        self.assertEqual(expected, new_inv.paths2ids(paths))
+
+    def test_get_entries(self):
+        inv = Inventory()
+        inv.revision_id = b"revid"
+        inv.root.revision = b"rootrev"
+        inv.add(InventoryDirectory(b"dirid", "dir", inv.root.file_id))
+        inv.add(InventoryFile(b"fileid", "file", b"dirid"))
+        inv.get_entry(b"fileid").revision = b"filerev"
+        inv.get_entry(b"fileid").text_sha1 = b"ffff"
+        inv.get_entry(b"fileid").text_size = 1
+        inv.get_entry(b"dirid").revision = b"filerev"
+        chk_bytes = self.get_chk_bytes()
+        chk_inv = CHKInventory.from_inventory(chk_bytes, inv)
+        lines = chk_inv.to_lines()
+        new_inv = CHKInventory.deserialise(chk_bytes, lines, (b"revid",))
+        for an_inv in (inv, new_inv):
+            entries = an_inv.get_entries([b"fileid", b"missing", b"dirid"])
+            self.assertEqual({b"fileid", b"dirid"}, set(entries))
+            self.assertEqual("file", entries[b"fileid"].name)
+            self.assertEqual(b"filerev", entries[b"fileid"].revision)
+            self.assertEqual("dir", entries[b"dirid"].name)
+            self.assertEqual({}, an_inv.get_entries([]))
+
     def test_create_by_apply_delta_sets_root(self):
         inv = Inventory()
         inv.root.revision = b"myrootrev"
@@ -16,7 +16,7 @@
 
 """Tests for InventoryWorkingTree"""
 
-from . import TestCase
+from . import TestCase, TestCaseWithTransport
 
 from ..workingtree import InventoryModified
 
@@ -29,3 +29,46 @@ class ErrorTests(TestCase):
                              "be repred' has been modified, so a clean inventory cannot be "
                              "read without data loss.",
                              str(error))
+
+
+class TestCanonicalInventoryPath(TestCaseWithTransport):
+
+    def make_tree(self):
+        tree = self.make_branch_and_tree('.')
+        self.build_tree(['Dir/', 'Dir/File', 'Dir/file2'])
+        tree.add(['Dir', 'Dir/File', 'Dir/file2'])
+        self.addCleanup(tree.lock_read().unlock)
+        return tree
+
+    def test_case_insensitive(self):
+        tree = self.make_tree()
+        self.assertEqual(
+            'Dir/File', tree._get_canonical_inventory_path('dir/FILE', str.lower))
+        self.assertEqual(
+            'Dir/new/file',
+            tree._get_canonical_inventory_path('dir/new/file', str.lower))
+        self.assertEqual(
+            'File', tree._get_canonical_inventory_path('File', str.lower))
+
+    def test_shared_resolved(self):
+        tree = self.make_tree()
+        resolved = {}
+        self.assertEqual(
+            ['Dir/File', 'Dir/file2', 'Dir/new'],
+            [tree._get_canonical_inventory_path(path, str.lower, resolved)
+             for path in ['dir/file', 'DIR/FILE2', 'dir/new']])
+        self.assertEqual({'/dir', '/dir/file', '/DIR', '/DIR/FILE2'},
+                         set(resolved))
+
+    def test_shared_normalized_children(self):
+        tree = self.make_tree()
+        resolved = {}
+        normalized_children = {}
+        self.assertEqual(
+            ['Dir/File', 'Dir/file2'],
+            [tree._get_canonical_inventory_path(
+                path, str.lower, resolved, normalized_children)
+             for path in ['dir/FILE', 'Dir/FILE2']])
+        self.assertEqual(
+            {'file', 'file2'},
+            set(normalized_children[tree.path2id('Dir')]))
@@ -384,14 +384,27 @@ class VersionedFileCommitBuilder(CommitBuilder):
         # Setup the changes from the tree:
         # changes maps file_id -> (change, [parent revision_ids])
         changes = {}
-        for change in iter_changes:
-            # This probably looks up in basis_inv way to much.
-            if change.path[0] is not None:
-                head_candidate = [basis_inv.get_entry(change.file_id).revision]
-            else:
-                head_candidate = []
-            changes[change.file_id] = change, merged_ids.get(
-                change.file_id, head_candidate)
+        # Look up the basis entries of the changes a batch at a time, rather
+        # than walking basis_inv once per changed file.
+        iter_changes = iter(iter_changes)
+        while True:
+            batch = list(itertools.islice(iter_changes, 1000))
+            if not batch:
+                break
+            basis_entries = basis_inv.get_entries(
+                [change.file_id for change in batch
+                 if change.path[0] is not None])
+            for change in batch:
+                if change.path[0] is not None:
+                    try:
+                        basis_entry = basis_entries[change.file_id]
+                    except KeyError:
+                        raise errors.NoSuchId(basis_inv, change.file_id)
+                    head_candidate = [basis_entry.revision]
+                else:
+                    head_candidate = []
+                changes[change.file_id] = change, merged_ids.get(
+                    change.file_id, head_candidate)
         unchanged_merged = set(merged_ids) - set(changes)
         # Extend the changes dict with synthetic changes to record merges of
         # texts.
@@ -77,7 +77,6 @@ from ..lock import LogicalLockResult
 from .inventorytree import InventoryRevisionTree, MutableInventoryTree
 from ..trace import mutter, note
 from ..tree import (
-    get_canonical_path,
     MissingNestedTree,
     TreeDirectory,
     TreeEntry,
@@ -1837,11 +1836,16 @@ class InventoryWorkingTree(WorkingTree, MutableInventoryTree):
                     return unicodedata.normalize('NFC', x)
             else:
                 normalize = None
+            # The directories matched and searched so far, shared by all the
+            # paths
+            resolved = {}
+            normalized_children = {}
             for path in paths:
                 if normalize is None or self.is_versioned(path):
                     yield path.strip('/')
                 else:
-                    yield get_canonical_path(self, path, normalize)
+                    yield self._get_canonical_inventory_path(
+                        path, normalize, resolved, normalized_children)
 
     def get_reference_info(self, path, branch=None):
         file_id = self.path2id(path)
@@ -86,6 +86,33 @@ class CannotCommitSelectedFileMerge(BzrError):
         BzrError.__init__(self, files=files, files_str=files_str)
 
 
+def _excluded_matcher(exclude):
+    """Build a function telling whether a path is inside an excluded path.
+
+    Rather than comparing each path with every excluded path, the path and
+    its parent directories are looked up in a set.
+
+    :param exclude: List of paths to exclude
+    :return: Function taking a path and returning whether it is excluded
+    """
+    if any(not path or path.endswith('/') for path in exclude):
+        # is_inside treats these specially
+        return lambda path: is_inside_any(exclude, path)
+    excluded = frozenset(exclude)
+
+    def is_excluded(path):
+        if path in excluded:
+            return True
+        i = path.rfind('/')
+        while i > 0:
+            path = path[:i]
+            if path in excluded:
+                return True
+            i = path.rfind('/')
+        return False
+    return is_excluded
+
+
 def filter_excluded(iter_changes, exclude):
     """Filter exclude filenames.
 
@@ -93,12 +120,13 @@ def filter_excluded(iter_changes, exclude):
     :param exclude: List of paths to exclude
     :return: iter_changes function
     """
+    is_excluded = _excluded_matcher(exclude)
     for change in iter_changes:
         new_excluded = (change.path[1] is not None and
-                        is_inside_any(exclude, change.path[1]))
+                        is_excluded(change.path[1]))
 
         old_excluded = (change.path[0] is not None and
-                        is_inside_any(exclude, change.path[0]))
+                        is_excluded(change.path[0]))
 
         if old_excluded and new_excluded:
             continue
@@ -126,9 +126,9 @@ def get_root_name(dest):
         # Exporting to -/foo doesn't make sense so use relative paths.
         return ''
     dest = os.path.basename(dest)
-    for ext in archive.format_registry.extensions:
-        if dest.endswith(ext):
-            return dest[:-len(ext)]
+    ext = archive.format_registry.get_extension(dest)
+    if ext is not None:
+        return dest[:-len(ext)]
     return dest
 
 
@@ -145,30 +145,122 @@ def _export_iter_entries(tree, subdir, skip_special=True, recurse_nested=False):
         subdir = None
     if subdir is not None:
         subdir = subdir.rstrip('/')
-    entries = tree.iter_entries_by_dir(recurse_nested=recurse_nested)
+        subdir_prefix = subdir + '/'
+        subdir_prefix_len = len(subdir_prefix)
+    entries = None
+    if subdir is not None and not recurse_nested:
+        entries = _iter_subdir_entries(tree, subdir)
+    if entries is None:
+        entries = tree.iter_entries_by_dir(recurse_nested=recurse_nested)
+    # Bind the per-entry tree methods once, this loop runs for every entry
+    # of the tree.
+    is_special_path = tree.is_special_path
+    has_filename = tree.has_filename
     for path, entry in entries:
         if path == '':
             continue
-
-        if skip_special and tree.is_special_path(path):
-            continue
-        if path == subdir:
+        # Filter on the path first, it's cheaper than querying the tree
+        if subdir is None:
+            final_path = path
+        elif path == subdir:
             if entry.kind == 'directory':
                 continue
             final_path = entry.name
-        elif subdir is not None:
-            if path.startswith(subdir + '/'):
-                final_path = path[len(subdir) + 1:]
-            else:
-                continue
+        elif path.startswith(subdir_prefix):
+            final_path = path[subdir_prefix_len:]
         else:
-            final_path = path
-        if not tree.has_filename(path):
+            continue
+        if skip_special and is_special_path(path):
+            continue
+        if not has_filename(path):
             continue
 
         yield final_path, path, entry
 
 
+def _export_iter_contents(tree, entries, batch_size=100,
+                          batch_bytes=4 * 1024 * 1024):
+    """Add the content of the files to export entries.
+
+    The texts of the files are requested from the tree in batches with
+    iter_files_bytes, which lets trees backed by a repository fetch them
+    together rather than one at a time.
+
+    The texts of a batch are held in memory until they have been exported,
+    so a batch is also capped by the summed size of its texts. Files larger
+    than that, or whose size is unknown, are fetched on their own.
+
+    :param tree: A tree object.
+    :param entries: An iterator over (final_path, tree_path, entry) tuples as
+        returned by _export_iter_entries.
+    :param batch_size: The maximum number of entries to read ahead.
+    :param batch_bytes: The maximum size of the texts to read ahead.
+    :return: iterator over (final_path, tree_path, entry, content) tuples,
+        content is None for entries that are not files.
+    """
+    batch = []
+    text_bytes = 0
+    for item in entries:
+        entry = item[2]
+        if entry.kind == 'file':
+            size = entry.text_size
+            if size is None:
+                size = batch_bytes
+            if batch and text_bytes + size > batch_bytes:
+                yield from _fetch_contents(tree, batch)
+                batch = []
+                text_bytes = 0
+            text_bytes += size
+        batch.append(item)
+        if len(batch) >= batch_size or text_bytes >= batch_bytes:
+            yield from _fetch_contents(tree, batch)
+            batch = []
+            text_bytes = 0
+    yield from _fetch_contents(tree, batch)
+
+
+def _fetch_contents(tree, batch):
+    to_fetch = [(tree_path, i)
+                for i, (final_path, tree_path, entry) in enumerate(batch)
+                if entry.kind == 'file']
+    contents = {}
+    if to_fetch:
+        for i, chunks in tree.iter_files_bytes(to_fetch):
+            contents[i] = b''.join(chunks)
+    for i, (final_path, tree_path, entry) in enumerate(batch):
+        yield final_path, tree_path, entry, contents.pop(i, None)
+
+
+def _iter_subdir_entries(tree, subdir):
+    """Iterate only the entries below subdir, if the tree allows it.
+
+    Inventory based trees can walk a single directory of their inventory,
+    which avoids visiting the whole tree when exporting a small subdir.
+
+    :return: An iterator over (path, entry) tuples, or None if the tree
+        can not be walked from subdir.
+    """
+    inv = getattr(tree, 'root_inventory', None)
+    if inv is None:
+        return None
+    try:
+        file_id = tree.path2id(subdir)
+    except errors.UnsupportedOperation:
+        return None
+    if file_id is None or not inv.has_id(file_id):
+        return None
+    entry = inv.get_entry(file_id)
+    if entry.kind != 'directory':
+        return iter([(subdir, entry)])
+    return _prefixed_entries(
+        subdir + '/', inv.iter_entries_by_dir(from_dir=file_id))
+
+
+def _prefixed_entries(prefix, entries):
+    for path, entry in entries:
+        yield prefix + path, entry
+
+
 def dir_exporter_generator(tree, dest, root, subdir=None,
                            force_mtime=None, fileobj=None,
                            recurse_nested=False):
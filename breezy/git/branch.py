@@ -155,8 +155,7 @@ class InterTagsFromGitToRemoteGit(InterTags):
 
         def get_changed_refs(old_refs):
             ret = dict(old_refs)
-            for ref_name, tag_name, peeled, unpeeled in (
-                    source_tag_refs.iteritems()):
+            for ref_name, tag_name, peeled, unpeeled in source_tag_refs:
                 if selector and not selector(tag_name):
                     continue
                 if old_refs.get(ref_name) == unpeeled:
@@ -323,7 +323,7 @@ class cmd_git_push_pristine_tar_deltas(Command):
         git_store = get_object_store(source.repository)
         with git_store.lock_read():
             tag_dict = source.tags.get_tag_dict()
-            for name, revid in tag_dict.iteritems():
+            for name, revid in tag_dict.items():
                 try:
                     rev = source.repository.get_revision(revid)
                 except NoSuchRevision:
@@ -94,15 +94,29 @@ class GitFileParentProvider:
     def __init__(self, change_scanner):
         self.change_scanner = change_scanner
         self.store = self.change_scanner.repository._git.object_store
+        # Git paths of the file ids looked up so far, by mapping class and
+        # file id; the same file id is usually asked about for many revisions.
+        self._paths = {}
+
+    def _get_path(self, mapping, file_id):
+        key = (type(mapping), file_id)
+        try:
+            path = self._paths[key]
+        except KeyError:
+            try:
+                path = encode_git_path(mapping.parse_file_id(file_id))
+            except ValueError:
+                path = None
+            self._paths[key] = path
+        if path is None:
+            raise KeyError(file_id)
+        return path
 
     def _get_parents(self, file_id, text_revision):
         commit_id, mapping = (
             self.change_scanner.repository.lookup_bzr_revision_id(
                 text_revision))
-        try:
-            path = encode_git_path(mapping.parse_file_id(file_id))
-        except ValueError:
-            raise KeyError(file_id)
+        path = self._get_path(mapping, file_id)
         text_parents = []
         for commit_parent in self.store[commit_id].parents:
             try:
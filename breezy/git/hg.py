@@ -36,7 +36,7 @@ def format_hg_metadata(renames, branch, extra):
         for oldfile, newfile in renames:
             extra_message += "rename : " + oldfile + " => " + newfile + "\n"
 
-    for key, value in extra.iteritems():
+    for key, value in extra.items():
         if key in ('author', 'committer', 'encoding', 'message', 'branch',
                    'hg-git'):
             continue
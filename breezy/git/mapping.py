@@ -19,9 +19,17 @@
 """Converters, etc for going between Bazaar and Git ids."""
 
 import base64
+import re
 import stat
 from typing import Optional
 
+from dulwich.objects import (
+    S_IFGITLINK,
+    Blob,
+    Commit,
+    Tag,
+    )
+from dulwich.protocol import ZERO_SHA
 import fastbencode as bencode
 
 from .. import (
@@ -71,6 +79,13 @@ FILE_ID_PREFIX = b'git:'
 # Always the same.
 ROOT_ID = b"TREE_ROOT"
 
+# Revision properties that are represented in the git commit itself
+_MAPPING_PROPERTIES = frozenset([
+    'author', 'author-timezone', 'author-timezone-neg-utc',
+    'commit-timezone-neg-utc', 'git-implicit-encoding',
+    'git-gpg-signature', 'git-explicit-encoding',
+    'author-timestamp', 'file-modes'])
+
 
 class UnknownCommitExtra(errors.BzrError):
     _fmt = "Unknown extra fields in %(object)r: %(fields)r."
@@ -105,28 +120,28 @@ def escape_file_id(file_id):
     return file_id
 
 
+_UNESCAPE_MAP = {b'_': b'_', b's': b' ', b'c': b'\x0c'}
+_UNESCAPE_RE = re.compile(b'_(.?)', re.DOTALL)
+
+
+def _unescape_char(m):
+    try:
+        return _UNESCAPE_MAP[m.group(1)]
+    except KeyError:
+        raise ValueError("unknown escape character %s" % m.group(1))
+
+
 def unescape_file_id(file_id):
-    ret = bytearray()
-    i = 0
-    while i < len(file_id):
-        if file_id[i:i + 1] != b'_':
-            ret.append(file_id[i])
-        else:
-            if file_id[i + 1:i + 2] == b'_':
-                ret.append(b"_"[0])
-            elif file_id[i + 1:i + 2] == b's':
-                ret.append(b" "[0])
-            elif file_id[i + 1:i + 2] == b'c':
-                ret.append(b"\x0c"[0])
-            else:
-                raise ValueError("unknown escape character %s" %
-                                 file_id[i + 1:i + 2])
-            i += 1
-        i += 1
-    return bytes(ret)
+    return _UNESCAPE_RE.sub(_unescape_char, file_id)
+
+
+# Identifiers of the form "username <email>", which need no fixing
+_WELL_FORMED_PERSON_RE = re.compile(b'[^<>]* <[^<>]*>')
 
 
 def fix_person_identifier(text):
+    if _WELL_FORMED_PERSON_RE.fullmatch(text) is not None:
+        return text
     if b"<" not in text and b">" not in text:
         username = text
         email = text
@@ -174,6 +189,20 @@ class BzrGitMapping(foreign.VcsMapping):
     def __init__(self):
         super().__init__(foreign_vcs_git)
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        revid_prefix = getattr(cls, 'revid_prefix', None)
+        if revid_prefix is not None:
+            cls._revid_prefix_colon = revid_prefix + b":"
+        # Mappings are stateless, so each class only needs one instance.
+        cls._instance = None
+
+    @classmethod
+    def _get_instance(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
     def __eq__(self, other):
         return (type(self) == type(other)
                 and self.revid_prefix == other.revid_prefix)
@@ -181,17 +210,17 @@ class BzrGitMapping(foreign.VcsMapping):
     @classmethod
     def revision_id_foreign_to_bzr(cls, git_rev_id):
         """Convert a git revision id handle to a Bazaar revision id."""
-        from dulwich.protocol import ZERO_SHA
         if git_rev_id == ZERO_SHA:
             return NULL_REVISION
-        return b"%s:%s" % (cls.revid_prefix, git_rev_id)
+        return cls._revid_prefix_colon + git_rev_id
 
     @classmethod
     def revision_id_bzr_to_foreign(cls, bzr_rev_id):
         """Convert a Bazaar revision id to a git revision id handle."""
-        if not bzr_rev_id.startswith(b"%s:" % cls.revid_prefix):
+        prefix = cls._revid_prefix_colon
+        if not bzr_rev_id.startswith(prefix):
             raise errors.InvalidRevisionId(bzr_rev_id, cls)
-        return bzr_rev_id[len(cls.revid_prefix) + 1:], cls()
+        return bzr_rev_id[len(prefix):], cls._get_instance()
 
     def generate_file_id(self, path):
         # Git paths are just bytestrings
@@ -211,39 +240,35 @@ class BzrGitMapping(foreign.VcsMapping):
 
     def import_unusual_file_modes(self, rev, unusual_file_modes):
         if unusual_file_modes:
-            ret = [(path, unusual_file_modes[path])
-                   for path in sorted(unusual_file_modes.keys())]
+            ret = sorted(unusual_file_modes.items())
             rev.properties['file-modes'] = bencode.bencode(ret)
 
     def export_unusual_file_modes(self, rev):
-        try:
-            file_modes = rev.properties['file-modes']
-        except KeyError:
+        file_modes = rev.properties.get('file-modes')
+        if file_modes is None:
             return {}
-        else:
-            return dict(bencode.bdecode(file_modes.encode("utf-8")))
+        # import_unusual_file_modes stores the bencoded modes as bytes
+        if isinstance(file_modes, str):
+            file_modes = file_modes.encode("utf-8")
+        return dict(bencode.bdecode(file_modes))
 
     def _generate_git_svn_metadata(self, rev, encoding):
-        try:
-            git_svn_id = rev.properties["git-svn-id"]
-        except KeyError:
-            return ""
-        else:
-            return "\ngit-svn-id: %s\n" % git_svn_id.encode(encoding)
+        git_svn_id = rev.properties.get("git-svn-id")
+        if git_svn_id is None:
+            return b""
+        return b"\ngit-svn-id: %s\n" % git_svn_id.encode(encoding)
 
     def _generate_hg_message_tail(self, rev):
         extra = {}
         renames = []
         branch = 'default'
-        for name in rev.properties:
+        for name, value in rev.properties.items():
             if name == 'hg:extra:branch':
-                branch = rev.properties['hg:extra:branch']
+                branch = value
             elif name.startswith('hg:extra'):
-                extra[name[len('hg:extra:'):]] = base64.b64decode(
-                    rev.properties[name])
+                extra[name[len('hg:extra:'):]] = base64.b64decode(value)
             elif name == 'hg:renames':
-                renames = bencode.bdecode(base64.b64decode(
-                    rev.properties['hg:renames']))
+                renames = bencode.bdecode(base64.b64decode(value))
             # TODO: Export other properties as 'bzr:' extras?
         ret = format_hg_metadata(renames, branch, extra)
         if not isinstance(ret, bytes):
@@ -251,15 +276,18 @@ class BzrGitMapping(foreign.VcsMapping):
         return ret
 
     def _extract_git_svn_metadata(self, rev, message):
-        lines = message.split("\n")
-        if not (lines[-1] == "" and len(lines) >= 2 and
-                lines[-2].startswith("git-svn-id:")):
+        # Only the last line can hold the git-svn-id, so avoid splitting
+        # the whole message.
+        if not message.endswith("\n"):
+            return message
+        head, _, last_line = message[:-1].rpartition("\n")
+        if not last_line.startswith("git-svn-id:"):
             return message
-        git_svn_id = lines[-2].split(": ", 1)[1]
+        git_svn_id = last_line.split(": ", 1)[1]
         rev.properties['git-svn-id'] = git_svn_id
         (url, rev, uuid) = parse_git_svn_id(git_svn_id)
         # FIXME: Convert this to converted-from property somehow..
-        return "\n".join(lines[:-2])
+        return head
 
     def _extract_hg_metadata(self, rev, message):
         (message, renames, branch, extra) = extract_hg_metadata(message)
@@ -293,7 +321,6 @@ class BzrGitMapping(foreign.VcsMapping):
         :param verifiers: Verifiers info
         :return dulwich.objects.Commit represent the revision:
         """
-        from dulwich.objects import Commit, Tag
         commit = Commit()
         commit.tree = tree_sha
         if not lossy:
@@ -314,15 +341,12 @@ class BzrGitMapping(foreign.VcsMapping):
                     raise AssertionError("unexpected length for %r" % git_p)
                 parents.append(git_p)
         commit.parents = parents
-        try:
-            encoding = rev.properties['git-explicit-encoding']
-        except KeyError:
-            encoding = rev.properties.get('git-implicit-encoding', 'utf-8')
-        try:
-            commit.encoding = rev.properties['git-explicit-encoding'].encode(
-                'ascii')
-        except KeyError:
-            pass
+        props = rev.properties
+        encoding = props.get('git-explicit-encoding')
+        if encoding is None:
+            encoding = props.get('git-implicit-encoding', 'utf-8')
+        else:
+            commit.encoding = encoding.encode('ascii')
         commit.committer = fix_person_identifier(rev.committer.encode(
             encoding))
         first_author = rev.get_apparent_authors()[0]
@@ -330,25 +354,25 @@ class BzrGitMapping(foreign.VcsMapping):
             first_author = first_author.split(',')[0]
         commit.author = fix_person_identifier(
             first_author.encode(encoding))
-        # TODO(jelmer): Don't use this hack.
-        long = getattr(__builtins__, 'long', int)
-        commit.commit_time = long(rev.timestamp)
-        if 'author-timestamp' in rev.properties:
-            commit.author_time = long(rev.properties['author-timestamp'])
+        commit.commit_time = int(rev.timestamp)
+        author_timestamp = props.get('author-timestamp')
+        if author_timestamp is not None:
+            commit.author_time = int(author_timestamp)
         else:
             commit.author_time = commit.commit_time
         commit._commit_timezone_neg_utc = (
-            "commit-timezone-neg-utc" in rev.properties)
+            "commit-timezone-neg-utc" in props)
         commit.commit_timezone = rev.timezone
         commit._author_timezone_neg_utc = (
-            "author-timezone-neg-utc" in rev.properties)
-        if 'author-timezone' in rev.properties:
-            commit.author_timezone = int(rev.properties['author-timezone'])
+            "author-timezone-neg-utc" in props)
+        author_timezone = props.get('author-timezone')
+        if author_timezone is not None:
+            commit.author_timezone = int(author_timezone)
         else:
             commit.author_timezone = commit.commit_timezone
-        if 'git-gpg-signature' in rev.properties:
-            commit.gpgsig = rev.properties['git-gpg-signature'].encode(
-                'utf-8', 'surrogateescape')
+        gpg_signature = props.get('git-gpg-signature')
+        if gpg_signature is not None:
+            commit.gpgsig = gpg_signature.encode('utf-8', 'surrogateescape')
         commit.message = self._encode_commit_message(rev, rev.message,
                                                      encoding)
         if not isinstance(commit.message, bytes):
@@ -358,13 +382,8 @@ class BzrGitMapping(foreign.VcsMapping):
                 mapping_registry.parse_revision_id(rev.revision_id)
             except errors.InvalidRevisionId:
                 metadata.revision_id = rev.revision_id
-            mapping_properties = {
-                'author', 'author-timezone', 'author-timezone-neg-utc',
-                'commit-timezone-neg-utc', 'git-implicit-encoding',
-                'git-gpg-signature', 'git-explicit-encoding',
-                'author-timestamp', 'file-modes'}
-            for k, v in rev.properties.items():
-                if k not in mapping_properties:
+            for k, v in props.items():
+                if k not in _MAPPING_PROPERTIES:
                     metadata.properties[k] = v
         if not lossy and metadata:
             if self.roundtripping:
@@ -376,14 +395,15 @@ class BzrGitMapping(foreign.VcsMapping):
         if not isinstance(commit.message, bytes):
             raise TypeError(commit.message)
         i = 0
-        propname = 'git-mergetag-0'
-        while propname in rev.properties:
+        mergetag = props.get('git-mergetag-0')
+        while mergetag is not None:
             commit.mergetag.append(
-                Tag.from_string(rev.properties[propname].encode('utf-8', 'surrogateescape')))
+                Tag.from_string(mergetag.encode('utf-8', 'surrogateescape')))
             i += 1
-            propname = 'git-mergetag-%d' % i
-        if 'git-extra' in rev.properties:
-            for l in rev.properties['git-extra'].splitlines():
+            mergetag = props.get('git-mergetag-%d' % i)
+        extra = props.get('git-extra')
+        if extra is not None:
+            for l in extra.splitlines():
                 (k, v) = l.split(' ', 1)
                 commit.extra.append(
                     (k.encode('utf-8', 'surrogateescape'),
@@ -416,49 +436,52 @@ class BzrGitMapping(foreign.VcsMapping):
         rev = ForeignRevision(commit.id, self,
                               self.revision_id_foreign_to_bzr(commit.id))
         rev.git_metadata = None
+        props = rev.properties
 
-        def decode_using_encoding(rev, commit, encoding):
-            try:
-                rev.committer = commit.committer.decode(encoding)
-            except LookupError:
-                raise UnknownCommitEncoding(encoding)
+        committer = commit.committer
+        author = commit.author
+        if author == committer:
+            author = None
+
+        def decode_using_encoding(rev, encoding):
             try:
-                if commit.committer != commit.author:
-                    rev.properties['author'] = commit.author.decode(encoding)
+                rev.committer = committer.decode(encoding)
+                if author is not None:
+                    props['author'] = author.decode(encoding)
             except LookupError:
                 raise UnknownCommitEncoding(encoding)
             rev.message, rev.git_metadata = self._decode_commit_message(
                 rev, commit.message, encoding)
 
         if commit.encoding is not None:
-            rev.properties['git-explicit-encoding'] = commit.encoding.decode(
+            props['git-explicit-encoding'] = commit.encoding.decode(
                 'ascii')
         if commit.encoding is not None and commit.encoding != b'false':
-            decode_using_encoding(rev, commit, commit.encoding.decode('ascii'))
+            decode_using_encoding(rev, commit.encoding.decode('ascii'))
         else:
             for encoding in ('utf-8', 'latin1'):
                 try:
-                    decode_using_encoding(rev, commit, encoding)
+                    decode_using_encoding(rev, encoding)
                 except UnicodeDecodeError:
                     pass
                 else:
                     if encoding != 'utf-8':
-                        rev.properties['git-implicit-encoding'] = encoding
+                        props['git-implicit-encoding'] = encoding
                     break
         if commit.commit_time != commit.author_time:
-            rev.properties['author-timestamp'] = str(commit.author_time)
+            props['author-timestamp'] = str(commit.author_time)
         if commit.commit_timezone != commit.author_timezone:
-            rev.properties['author-timezone'] = "%d" % commit.author_timezone
+            props['author-timezone'] = "%d" % commit.author_timezone
         if commit._author_timezone_neg_utc:
-            rev.properties['author-timezone-neg-utc'] = ""
+            props['author-timezone-neg-utc'] = ""
         if commit._commit_timezone_neg_utc:
-            rev.properties['commit-timezone-neg-utc'] = ""
+            props['commit-timezone-neg-utc'] = ""
         if commit.gpgsig:
-            rev.properties['git-gpg-signature'] = commit.gpgsig.decode(
+            props['git-gpg-signature'] = commit.gpgsig.decode(
                 'utf-8', 'surrogateescape')
         if commit.mergetag:
             for i, tag in enumerate(commit.mergetag):
-                rev.properties['git-mergetag-%d' % i] = tag.as_raw_string().decode(
+                props['git-mergetag-%d' % i] = tag.as_raw_string().decode(
                     'utf-8', 'surrogateescape')
         rev.timestamp = commit.commit_time
         rev.timezone = commit.commit_timezone
@@ -468,7 +491,7 @@ class BzrGitMapping(foreign.VcsMapping):
             roundtrip_revid = md.revision_id
             if md.explicit_parent_ids:
                 rev.parent_ids = md.explicit_parent_ids
-            rev.properties.update(md.properties)
+            props.update(md.properties)
             verifiers = md.verifiers
         else:
             roundtrip_revid = None
@@ -483,9 +506,10 @@ class BzrGitMapping(foreign.VcsMapping):
             rev.parent_ids = list(parents)
         unknown_extra_fields = []
         extra_lines = []
+        append_extra_line = extra_lines.append
         for k, v in commit.extra:
             if k == HG_RENAME_SOURCE:
-                extra_lines.append(
+                append_extra_line(
                     k.decode('utf-8', 'surrogateescape') + ' ' +
                     v.decode('utf-8', 'surrogateescape') + '\n')
             elif k == HG_EXTRA:
@@ -495,7 +519,7 @@ class BzrGitMapping(foreign.VcsMapping):
                                HG_EXTRA_SOURCE, HG_EXTRA_TOPIC,
                                HG_EXTRA_REWRITE_NOISE) and strict:
                     raise UnknownMercurialCommitExtra(commit, [hgk])
-                extra_lines.append(
+                append_extra_line(
                     k.decode('utf-8', 'surrogateescape') + ' ' +
                     v.decode('utf-8', 'surrogateescape') + '\n')
             else:
@@ -505,7 +529,7 @@ class BzrGitMapping(foreign.VcsMapping):
                 commit,
                 [f.decode('ascii', 'replace') for f in unknown_extra_fields])
         if extra_lines:
-            rev.properties['git-extra'] = ''.join(extra_lines)
+            props['git-extra'] = ''.join(extra_lines)
         return rev, roundtrip_revid, verifiers
 
 
@@ -536,10 +560,10 @@ class BzrGitMappingExperimental(BzrGitMappingv1):
             raise UnknownCommitEncoding(encoding)
 
     def _encode_commit_message(self, rev, message, encoding):
-        ret = message.encode(encoding)
-        ret += self._generate_hg_message_tail(rev)
-        ret += self._generate_git_svn_metadata(rev, encoding)
-        return ret
+        return b"".join([
+            message.encode(encoding),
+            self._generate_hg_message_tail(rev),
+            self._generate_git_svn_metadata(rev, encoding)])
 
     def import_commit(self, commit, lookup_parent_revid, strict=True):
         rev, roundtrip_revid, verifiers = super().import_commit(
@@ -551,14 +575,35 @@ class BzrGitMappingExperimental(BzrGitMappingv1):
 class GitMappingRegistry(VcsMappingRegistry):
     """Registry with available git mappings."""
 
+    def __init__(self):
+        super().__init__()
+        # Mappings by version, so that parsing a revision id doesn't have
+        # to go through the registry.
+        self._mappings = {}
+
+    def register(self, *args, **kwargs):
+        self._mappings.clear()
+        super().register(*args, **kwargs)
+
+    def register_lazy(self, *args, **kwargs):
+        self._mappings.clear()
+        super().register_lazy(*args, **kwargs)
+
+    def remove(self, key):
+        self._mappings.clear()
+        super().remove(key)
+
     def revision_id_bzr_to_foreign(self, bzr_revid):
         if bzr_revid == NULL_REVISION:
-            from dulwich.protocol import ZERO_SHA
             return ZERO_SHA, None
         if not bzr_revid.startswith(b"git-"):
             raise errors.InvalidRevisionId(bzr_revid, None)
         (mapping_version, git_sha) = bzr_revid.split(b":", 1)
-        mapping = self.get(mapping_version)
+        try:
+            mapping = self._mappings[mapping_version]
+        except KeyError:
+            mapping = self._mappings[mapping_version] = self.get(
+                mapping_version)
         return mapping.revision_id_bzr_to_foreign(bzr_revid)
 
     parse_revision_id = revision_id_bzr_to_foreign
@@ -609,7 +654,6 @@ default_mapping = mapping_registry.get_default()()
 
 
 def symlink_to_blob(symlink_target):
-    from dulwich.objects import Blob
     blob = Blob()
     if isinstance(symlink_target, str):
         symlink_target = encode_git_path(symlink_target)
@@ -622,15 +666,28 @@ def mode_is_executable(mode):
     return bool(mode & 0o111)
 
 
+# Kinds of the usual git modes, by file type bits
+_MODE_KINDS = {
+    stat.S_IFDIR: 'directory',
+    stat.S_IFREG: 'file',
+    stat.S_IFLNK: 'symlink',
+    S_IFGITLINK: 'tree-reference',
+    }
+
+
 def mode_kind(mode):
     """Determine the Bazaar inventory kind based on Unix file mode."""
     if mode is None:
         return None
-    entry_kind = (mode & 0o700000) / 0o100000
+    try:
+        return _MODE_KINDS[mode & 0o770000]
+    except KeyError:
+        pass
+    entry_kind = (mode & 0o700000) // 0o100000
     if entry_kind == 0:
         return 'directory'
     elif entry_kind == 1:
-        file_kind = (mode & 0o70000) / 0o10000
+        file_kind = (mode & 0o70000) // 0o10000
         if file_kind == 0:
             return 'file'
         elif file_kind == 2:
@@ -659,7 +716,6 @@ def object_mode(kind, executable):
             mode |= 0o111
         return mode
     elif kind == 'tree-reference':
-        from dulwich.objects import S_IFGITLINK
         return S_IFGITLINK
     else:
         raise AssertionError
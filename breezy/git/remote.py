@@ -634,7 +634,7 @@ class RemoteGitDir(GitDir):
             return self._refs
         result = self.fetch_pack(lambda x: None, None,
                                  lambda x: None,
-                                 lambda x: trace.mutter("git: %s" % x))
+                                 lambda x: trace.mutter("git: %s", x))
         self._refs = remote_refs_dict_to_container(
             result.refs, result.symrefs)
         return self._refs
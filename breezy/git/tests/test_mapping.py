@@ -93,6 +93,10 @@ class FileidTests(tests.TestCase):
     def test_unescape_underscore_space(self):
         self.assertEqual(b"bla _", unescape_file_id(b"bla_s__"))
 
+    def test_unescape_unknown(self):
+        self.assertRaises(ValueError, unescape_file_id, b"bla_x")
+        self.assertRaises(ValueError, unescape_file_id, b"bla_")
+
 
 class TestImportCommit(tests.TestCase):
 
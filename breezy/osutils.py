@@ -50,6 +50,10 @@ from hashlib import (
     md5,
     sha1 as sha,
     )
+try:
+    from hashlib import file_digest as _file_digest
+except ImportError:  # Python < 3.11
+    _file_digest = None
 
 
 import breezy
@@ -694,8 +698,13 @@ def size_sha_file(f):
 
 def sha_file_by_name(fname):
     """Calculate the SHA1 of a file by reading the full text"""
-    s = sha()
     f = os.open(fname, os.O_RDONLY | O_BINARY | O_NOINHERIT)
+    if _file_digest is not None:
+        # Let hashlib read the file into a reusable buffer rather than
+        # allocating a bytes object per block.
+        with open(f, 'rb', buffering=0) as fileobj:
+            return _hexdigest(_file_digest(fileobj, sha))
+    s = sha()
     try:
         while True:
             b = os.read(f, 1 << 16)
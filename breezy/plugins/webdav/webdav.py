@@ -322,7 +322,7 @@ class DavResponse(urllib.Response):
     """
     _body_ignored_responses = (
         urllib.Response._body_ignored_responses
-        + [201, 405, 409, 412]
+        | {201, 405, 409, 412}
         )
 
     def begin(self):
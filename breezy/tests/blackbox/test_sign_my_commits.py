@@ -35,13 +35,15 @@ class SignMyCommits(tests.TestCaseWithTransport):
 
     def setup_tree(self, location='.'):
         wt = self.make_branch_and_tree(location)
-        wt.commit("base A", allow_pointless=True, rev_id=b'A')
-        wt.commit("base B", allow_pointless=True, rev_id=b'B')
-        wt.commit("base C", allow_pointless=True, rev_id=b'C')
-        wt.commit("base D", allow_pointless=True, rev_id=b'D',
-                  committer='Alternate <alt@foo.com>')
-        wt.add_parent_tree_id(b"aghost")
-        wt.commit("base E", allow_pointless=True, rev_id=b'E')
+        # Hold the lock across the commits rather than taking it per commit.
+        with wt.lock_write():
+            wt.commit("base A", allow_pointless=True, rev_id=b'A')
+            wt.commit("base B", allow_pointless=True, rev_id=b'B')
+            wt.commit("base C", allow_pointless=True, rev_id=b'C')
+            wt.commit("base D", allow_pointless=True, rev_id=b'D',
+                      committer='Alternate <alt@foo.com>')
+            wt.add_parent_tree_id(b"aghost")
+            wt.commit("base E", allow_pointless=True, rev_id=b'E')
         return wt
 
     def assertUnsigned(self, repo, revision_id):
@@ -24,12 +24,14 @@ import time
 import zipfile
 
 from .. import (
+    archive,
     errors,
     export,
     tests,
     )
 from ..export import get_root_name
 from ..archive.tar import tarball_generator
+from ..archive.zip import zip_archive_generator
 from . import features
 
 
@@ -291,6 +293,63 @@ class ZipExporterTests(tests.TestCaseWithTransport):
         info = zfile.getinfo("test/har")
         self.assertEqual(time.localtime(timestamp)[:6], info.date_time)
 
+    def test_export_zip_generator(self):
+        wt = self.make_branch_and_tree('.')
+        self.build_tree(['a', 'b/', 'b/c'])
+        wt.add(['a', 'b', 'b/c'])
+        wt.commit("1", timestamp=347151600)
+        with wt.lock_read():
+            chunks = list(zip_archive_generator(wt, 'bar.zip', 'bar'))
+        # The archive is produced entry by entry
+        self.assertTrue(len([c for c in chunks if c]) > 1)
+        zfile = zipfile.ZipFile(BytesIO(b''.join(chunks)))
+        self.addCleanup(zfile.close)
+        self.assertIs(None, zfile.testzip())
+        self.assertEqual(['bar/a', 'bar/b/', 'bar/b/c'],
+                         sorted(zfile.namelist()))
+
+
+class ExportIterContentsTests(tests.TestCaseWithTransport):
+
+    def test_batches_keep_order(self):
+        self.build_tree_contents(
+            [('a', b'a content'), ('d/',), ('d/b', b'b content'),
+             ('d/c', b'c content')])
+        wt = self.make_branch_and_tree('.')
+        wt.add(['a', 'd', 'd/b', 'd/c'])
+        wt.commit('1')
+        tree = wt.basis_tree()
+        self.addCleanup(tree.lock_read().unlock)
+        entries = export._export_iter_entries(tree, None)
+        self.assertEqual(
+            [('a', b'a content'), ('d', None), ('d/b', b'b content'),
+             ('d/c', b'c content')],
+            [(final_path, content) for final_path, tree_path, entry, content
+             in export._export_iter_contents(tree, entries, batch_size=2)])
+
+    def test_large_text_fetched_alone(self):
+        self.build_tree_contents(
+            [('a', b'a'), ('b', b'b' * 20), ('c', b'c'), ('d', b'd')])
+        wt = self.make_branch_and_tree('.')
+        wt.add(['a', 'b', 'c', 'd'])
+        wt.commit('1')
+        tree = wt.basis_tree()
+        self.addCleanup(tree.lock_read().unlock)
+        fetched = []
+        iter_files_bytes = tree.iter_files_bytes
+
+        def recording_iter_files_bytes(desired_files):
+            fetched.append([path for path, identifier in desired_files])
+            return iter_files_bytes(desired_files)
+        tree.iter_files_bytes = recording_iter_files_bytes
+        entries = export._export_iter_entries(tree, None)
+        self.assertEqual(
+            [('a', b'a'), ('b', b'b' * 20), ('c', b'c'), ('d', b'd')],
+            [(final_path, content) for final_path, tree_path, entry, content
+             in export._export_iter_contents(tree, entries, batch_bytes=10)])
+        # The large text is not held in memory along with its neighbours
+        self.assertEqual([['a'], ['b'], ['c', 'd']], fetched)
+
 
 class RootNameTests(tests.TestCase):
 
@@ -306,3 +365,10 @@ class RootNameTests(tests.TestCase):
         self.assertEqual('other',
                          get_root_name('../parent/../dir/other.tbz2'))
         self.assertEqual('', get_root_name('-'))
+
+    def test_get_extension(self):
+        registry = archive.format_registry
+        self.assertEqual('.tar.gz', registry.get_extension('foo.tar.gz'))
+        self.assertEqual('.tgz', registry.get_extension('a.b/foo.tar.tgz'))
+        self.assertIs(None, registry.get_extension('foo.gz'))
+        self.assertIs(None, registry.get_extension('foo'))
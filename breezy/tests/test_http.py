@@ -25,6 +25,7 @@ transport implementation, http protocol versions and authentication schemes.
 
 from http.client import UnknownProtocol, parse_headers
 from http.server import SimpleHTTPRequestHandler
+import gzip
 import io
 import socket
 import sys
@@ -63,6 +64,7 @@ from ..transport.http import urllib
 from ..transport.http.urllib import (
     AbstractAuthHandler,
     BasicAuthHandler,
+    ConnectionHandler,
     HttpTransport,
     HTTPAuthHandler,
     HTTPConnection,
@@ -703,6 +705,94 @@ class TestForbiddenServer(TestSpecificRequestHandler):
         self.assertRaises(errors.TransportError, t.get, 'foo/bar')
 
 
+class GzipRequestHandler(http_server.TestingHTTPRequestHandler):
+    """Compress whole files for clients accepting gzip"""
+
+    def do_GET(self):
+        tcs = self.server.test_case_server
+        tcs.accept_encodings.append(self.headers.get('Accept-Encoding'))
+        accepted = self.headers.get('Accept-Encoding', '').split(',')
+        if (self.headers.get('Range') is not None
+                or 'gzip' not in [e.strip() for e in accepted]):
+            return http_server.TestingHTTPRequestHandler.do_GET(self)
+        try:
+            with open(self.translate_path(self.path), 'rb') as f:
+                content = gzip.compress(f.read())
+        except OSError:
+            self.send_error(404, "File not found")
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        # Check that the encoding is not matched verbatim
+        self.send_header('Content-Encoding', 'GZip ')
+        self.send_header('Content-Length', '%d' % len(content))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+class TestGzipServer(TestSpecificRequestHandler):
+    """Tests transparent decompression of whole files"""
+
+    _req_handler_class = GzipRequestHandler
+
+    def setUp(self):
+        super().setUp()
+        self.build_tree_contents([('a', b'0123456789' * 100)])
+        self.get_readonly_server().accept_encodings = []
+
+    def test_get(self):
+        t = self.get_readonly_transport()
+        self.assertEqual(b'0123456789' * 100, t.get_bytes('a'))
+        self.assertEqual(['gzip'],
+                         self.get_readonly_server().accept_encodings)
+
+    def test_readv_not_compressed(self):
+        t = self.get_readonly_transport()
+        self.assertEqual([(3, b'34'), (995, b'56789')],
+                         list(t.readv('a', ((3, 2), (995, 5)))))
+        self.assertEqual(['identity'],
+                         self.get_readonly_server().accept_encodings)
+
+    def test_connection_reused_after_gzip_body(self):
+        if self._protocol_version == 'HTTP/1.0':
+            raise tests.TestNotApplicable('HTTP/1.1 keep-alive only test')
+        t = self.get_readonly_transport()
+        f = t.get('a')
+        self.assertEqual(b'01234', f.read(5))
+        f.seek(995)
+        self.assertEqual(b'56789', f.read())
+        sock = t._get_connection().sock
+        self.assertEqual(b'0123456789' * 100, t.get_bytes('a'))
+        self.assertIs(sock, t._get_connection().sock)
+
+
+class MislabelledGzipRequestHandler(http_server.TestingHTTPRequestHandler):
+    """Label .gz files as gzip encoded, as misconfigured servers do"""
+
+    def end_headers(self):
+        if self.path.endswith('.gz'):
+            self.send_header('Content-Encoding', 'gzip')
+        http_server.TestingHTTPRequestHandler.end_headers(self)
+
+
+class TestMislabelledGzipServer(TestSpecificRequestHandler):
+    """Tests that content is decompressed only if gzip was accepted"""
+
+    _req_handler_class = MislabelledGzipRequestHandler
+
+    def setUp(self):
+        super().setUp()
+        self.content = gzip.compress(b'0123456789' * 100)
+        self.build_tree_contents([('a.gz', self.content)])
+
+    def test_readv_without_ranges(self):
+        t = self.get_readonly_transport()
+        # Force a range-less GET, which doesn't send Accept-Encoding
+        t._range_hint = None
+        self.assertEqual([(0, self.content[:4]), (10, self.content[10:15])],
+                         list(t.readv('a.gz', ((0, 4), (10, 5)))))
+
+
 class TestRecordingServer(tests.TestCase):
 
     def test_create(self):
@@ -1178,6 +1268,100 @@ class TestHttpProxyWhiteBox(tests.TestCase):
         self.assertEvaluateProxyBypass(None, 'example.com', 'foo,,bar')
 
 
+class TestRequestHeaders(tests.TestCase):
+
+    def test_merged_headers(self):
+        request = Request('GET', 'http://example.com/',
+                          headers={'range': 'bytes=0-1'})
+        request.add_unredirected_header('Host', 'example.org')
+        self.assertEqual({'Range': 'bytes=0-1', 'Host': 'example.org'},
+                         request.merged_headers())
+
+    def test_merged_headers_updated(self):
+        request = Request('GET', 'http://example.com/',
+                          headers={'Range': 'bytes=0-1'})
+        self.assertEqual({'Range': 'bytes=0-1'}, request.merged_headers())
+        request.add_header('Accept', '*/*')
+        self.assertEqual({'Range': 'bytes=0-1', 'Accept': '*/*'},
+                         request.merged_headers())
+        request.remove_header('Range')
+        self.assertEqual({'Accept': '*/*'}, request.merged_headers())
+
+
+class FakeResponse:
+    """A response still being read until closed is set."""
+
+    closed = False
+    finished = False
+    status = 200
+    will_close = False
+
+    def isclosed(self):
+        return self.closed
+
+    def finish(self):
+        self.finished = True
+
+
+class TestConnectionHandlerPool(tests.TestCase):
+    """Whitebox tests for the connections kept by ConnectionHandler."""
+
+    def capture(self, handler, url):
+        request = Request('GET', url)
+        return handler.http_request(request).connection
+
+    def test_same_host_reuses_connection(self):
+        handler = ConnectionHandler()
+        conn = self.capture(handler, 'http://example.com/foo')
+        self.assertIs(conn, self.capture(handler, 'http://example.com/bar'))
+
+    def test_default_port(self):
+        handler = ConnectionHandler()
+        conn = self.capture(handler, 'http://example.com/foo')
+        self.assertIs(conn, self.capture(handler, 'http://example.com:80/bar'))
+        self.assertIs(conn, self.capture(handler, 'http://Example.com/bar'))
+
+    def test_different_hosts(self):
+        handler = ConnectionHandler()
+        conn = self.capture(handler, 'http://example.com/foo')
+        self.assertIsNot(conn, self.capture(handler, 'http://example.org/foo'))
+        self.assertIsNot(
+            conn, self.capture(handler, 'http://example.com:8080/foo'))
+
+    def test_max_keepalive(self):
+        handler = ConnectionHandler()
+        handler.max_keepalive = 2
+        conn = self.capture(handler, 'http://one.example.com/')
+        self.capture(handler, 'http://two.example.com/')
+        self.capture(handler, 'http://three.example.com/')
+        self.assertEqual(2, len(handler._pool))
+        self.assertIsNot(conn, self.capture(handler, 'http://one.example.com/'))
+
+    def test_idle_timeout(self):
+        handler = ConnectionHandler()
+        handler.keepalive_timeout = -1
+        conn = self.capture(handler, 'http://example.com/foo')
+        self.assertIsNot(conn, self.capture(handler, 'http://example.com/bar'))
+
+    def test_connection_in_use_not_reused(self):
+        handler = ConnectionHandler()
+        conn = self.capture(handler, 'http://example.com/foo')
+        # A clone sharing conn is still reading a response from it
+        response = FakeResponse()
+        conn._response = response
+        other = self.capture(handler, 'http://example.com/bar')
+        self.assertIsNot(conn, other)
+        # The pending response has been left alone
+        self.assertFalse(response.finished)
+        self.assertIs(response, conn._response)
+        # Once the response has been read, conn is idle again
+        response.closed = True
+        request = Request('GET', 'http://example.com/foo')
+        request.connection = conn
+        handler.http_request(request)
+        self.assertIs(conn, self.capture(handler, 'http://example.com/baz'))
+
+
 class TestProxyHttpServer(http_utils.TestCaseWithTwoWebservers):
     """Tests proxy server.
 
@@ -61,10 +61,14 @@ class ReadSocket:
 
     def __init__(self, data):
         self.readfile = BytesIO(data)
+        self.closed = False
 
     def makefile(self, mode='r', bufsize=None):
         return self.readfile
 
+    def close(self):
+        self.closed = True
+
 
 class FakeHTTPConnection(urllib.HTTPConnection):
 
@@ -116,6 +120,66 @@ garbage""")
         conn.cleanup_pipe()
         self.assertContainsRe(self.get_log(), 'Got a 200 response when asking')
 
+    def get_response(self, data, method='GET'):
+        conn = FakeHTTPConnection(ReadSocket(data))
+        # Simulate the request sending so that the connection will be able to
+        # read the response.
+        conn.putrequest(method, 'http://localhost/fictious')
+        conn.endheaders()
+        return conn, conn.getresponse()
+
+    def test_cleanup_pipe_keeps_drained_socket(self):
+        conn, resp = self.get_response(b"""HTTP/1.1 200 OK\r
+Transfer-Encoding: chunked\r
+\r
+5\r
+01234\r
+5\r
+56789\r
+0\r
+\r
+""")
+        self.assertEqual(b'012', resp.read(3))
+        sock = conn.sock
+        conn.cleanup_pipe()
+        self.assertIs(sock, conn.sock)
+
+    def test_cleanup_pipe_closes_truncated_body(self):
+        conn, resp = self.get_response(b"""HTTP/1.1 200 OK\r
+Content-Length: 18\r
+\r
+0123456789
+""")
+        self.assertEqual(b'012', resp.read(3))
+        sock = conn.sock
+        conn.cleanup_pipe()
+        self.assertIs(None, conn.sock)
+        self.assertTrue(sock.closed)
+
+    def assertCleanupPipeKeepsSocket(self, data, method='GET'):
+        conn, resp = self.get_response(data, method)
+        sock = conn.sock
+        conn.cleanup_pipe()
+        self.assertIs(sock, conn.sock)
+        self.assertFalse(sock.closed)
+
+    def test_cleanup_pipe_keeps_socket_after_head(self):
+        self.assertCleanupPipeKeepsSocket(b"""HTTP/1.1 200 OK\r
+Content-Length: 18\r
+\r
+""", method='HEAD')
+
+    def test_cleanup_pipe_keeps_socket_after_no_content(self):
+        self.assertCleanupPipeKeepsSocket(b"""HTTP/1.1 204 No Content\r
+\r
+""")
+
+    def test_cleanup_pipe_keeps_socket_after_empty_body(self):
+        self.assertCleanupPipeKeepsSocket(b"""HTTP/1.1 200 OK\r
+Content-Length: 0\r
+\r
+""")
+
 
 class TestRangeFileMixin:
     """Tests for accessing the first range in a RangeFile."""
@@ -768,6 +768,13 @@ class TestLocalTransports(tests.TestCase):
         t = transport.get_transport(here)
         self.assertEqual(t.local_abspath(''), here)
 
+    def test_seek_and_read_without_fileno(self):
+        t = transport.get_transport('.')
+        # BytesIO.fileno() raises io.UnsupportedOperation
+        self.assertEqual(
+            [(1, b'12'), (5, b'567')],
+            list(t._seek_and_read(BytesIO(b'0123456789'), [(1, 2), (5, 3)])))
+
 
 class TestLocalTransportMutation(tests.TestCaseInTempDir):
 
@@ -717,6 +717,18 @@ class Transport:
         fp = self.get(relpath)
         return self._seek_and_read(fp, offsets, relpath)
 
+    def _read_at(self, fp, offset, length):
+        """Read up to length bytes from fp, starting at offset.
+
+        :param fp: A file-like object that supports seek() and read(size).
+        :return: The bytes read; may be short at the end of the file.
+        """
+        # TODO: jam 20060724 it might be faster to not issue seek if
+        #       we are already at the right location. This should be
+        #       benchmarked.
+        fp.seek(offset)
+        return fp.read(length)
+
     def _seek_and_read(self, fp, offsets, relpath='<unknown>'):
         """An implementation of readv that uses fp.seek and fp.read.
 
@@ -743,11 +755,7 @@ class Transport:
         data_map = {}
         try:
             for c_offset in coalesced:
-                # TODO: jam 20060724 it might be faster to not issue seek if
-                #       we are already at the right location. This should be
-                #       benchmarked.
-                fp.seek(c_offset.start)
-                data = fp.read(c_offset.length)
+                data = self._read_at(fp, c_offset.start, c_offset.length)
                 if len(data) < c_offset.length:
                     raise errors.ShortReadvError(relpath, c_offset.start,
                                                  c_offset.length, actual=len(data))
@@ -304,15 +304,25 @@ class RangeFile(ResponseFile):
                     % (size, self._start, self._size))
 
         # read data from file
-        buf = BytesIO()
         limited = size
         if self._size > 0:
             # Don't read past the range definition
             limited = self._start + self._size - self._pos
             if size >= 0:
                 limited = min(limited, size)
-        osutils.pumpfile(self._file, buf, limited, self._max_read_size)
-        data = buf.getvalue()
+        if 0 <= limited <= self._max_read_size:
+            # Most reads fit in a single block, so only go through a buffer
+            # if the underlying file returns less than asked for.
+            data = self._file.read(limited)
+            if data and len(data) < limited:
+                buf = BytesIO()
+                osutils.pumpfile(self._file, buf, limited - len(data),
+                                 self._max_read_size)
+                data += buf.getvalue()
+        else:
+            buf = BytesIO()
+            osutils.pumpfile(self._file, buf, limited, self._max_read_size)
+            data = buf.getvalue()
 
         # Update _pos respecting the data effectively read
         self._pos += len(data)
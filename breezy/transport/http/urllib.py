@@ -23,9 +23,13 @@ DEBUG = 0
 
 import base64
 import cgi
+import collections
 import errno
+import gzip
+import itertools
 import os
 import re
+import select
 import socket
 import ssl
 import sys
@@ -75,6 +79,9 @@ from . import default_user_agent, ssl
 checked_kerberos = False
 kerberos = None
 
+# The redirection codes we know how to follow
+_redirection_codes = frozenset([301, 302, 303, 307, 308])
+
 
 def splitport(host):
     m = re.fullmatch('(.*):([0-9]*)', host, re.DOTALL)
@@ -113,11 +120,32 @@ class _ReportingFileSocket:
         return getattr(self.filesock, name)
 
 
+class _SharedFile:
+    """A file shared by the responses read from the same socket.
+
+    Closing a response should not close the file since the following
+    responses are read from it.
+    """
+
+    def __init__(self, filesock):
+        self.filesock = filesock
+
+    def read(self, size=-1):
+        return self.filesock.read(size)
+
+    def close(self):
+        pass
+
+    def __getattr__(self, name):
+        return getattr(self.filesock, name)
+
+
 class _ReportingSocket:
 
     def __init__(self, sock, report_activity=None):
         self.sock = sock
         self._report_activity = report_activity
+        self._file = None
 
     def report_activity(self, size, direction):
         if self._report_activity:
@@ -133,6 +161,17 @@ class _ReportingSocket:
         return s
 
     def makefile(self, mode='r', bufsize=-1):
+        if mode != 'rb':
+            return self._makefile(mode)
+        # http.client creates a new file for each response, but once a
+        # response has been fully read, nothing is left in the buffer of its
+        # file. So we create a single one and share it between all the
+        # responses read from this socket.
+        if self._file is None:
+            self._file = self._makefile(mode)
+        return _SharedFile(self._file)
+
+    def _makefile(self, mode):
         # http.client creates a fileobject that doesn't do buffering, which
         # makes fp.readline() very expensive because it only reads one byte
         # at a time.  So we wrap the socket in an object that forces
@@ -141,6 +180,13 @@ class _ReportingSocket:
         # And wrap that into a reporting kind of fileobject
         return _ReportingFileSocket(fsock, self._report_activity)
 
+    def close(self):
+        # A response may still be reading from the shared file (http.client
+        # closes the connection before returning the response when the server
+        # will close it), the file is closed once released.
+        self._file = None
+        self.sock.close()
+
     def __getattr__(self, name):
         return getattr(self.sock, name)
 
@@ -154,13 +200,16 @@ class Response(http.client.HTTPResponse):
     """
 
     # Some responses have bodies in which we have no interest
-    _body_ignored_responses = [301, 302, 303, 307, 308, 404, 501]
+    _body_ignored_responses = _redirection_codes | {404, 501}
 
     # in finish() below, we may have to discard several MB in the worst
     # case. To avoid buffering that much, we read and discard by chunks
     # instead. The underlying file is either a socket or a StringIO, so reading
     # 8k chunks should be fine.
     _discarded_buf_size = 8192
+    # The discarded bytes are never looked at, so all responses can share
+    # the same buffer.
+    _discarded_buf = bytearray(_discarded_buf_size)
 
     def __init__(self, sock, debuglevel=0, method=None, url=None):
         self.url = url
@@ -180,17 +229,20 @@ class Response(http.client.HTTPResponse):
             if self.debuglevel >= 2:
                 print("For status: [{}], will ready body, length: {}".format(
                     self.status, self.length))
-            if not (self.length is None or self.will_close):
+            if not self.will_close and (self.length is not None
+                                        or self.chunked):
                 # In some cases, we just can't read the body not
                 # even try or we may encounter a 104, 'Connection
                 # reset by peer' error if there is indeed no body
                 # and the server closed the connection just after
                 # having issued the response headers (even if the
                 # headers indicate a Content-Type...)
-                body = self.read(self.length)
                 if self.debuglevel >= 9:
                     # This one can be huge and is generally not interesting
+                    body = self.read(self.length)
                     print("Consumed body: [%s]" % body)
+                else:
+                    self._discard_body()
             self.close()
         elif self.status == 200:
             # Whatever the request is, it went ok, so we surely don't want to
@@ -205,6 +257,21 @@ class Response(http.client.HTTPResponse):
             # below we keep the socket with the server opened.
             self.will_close = False
 
+    def _discard_body(self):
+        """Read and discard the rest of the body.
+
+        :return: the number of bytes discarded
+        """
+        buf = memoryview(self._discarded_buf)
+        discarded = 0
+        while self.length or (self.chunked and not self.isclosed()):
+            # readinto() will update self.length
+            read = self.readinto(buf)
+            if not read:
+                break
+            discarded += read
+        return discarded
+
     def finish(self):
         """Finish reading the body.
 
@@ -214,19 +281,29 @@ class Response(http.client.HTTPResponse):
         nothing will block the next request since a new connection will be
         issued anyway.
 
+        If the end of the body can't be found on the socket, will_close is
+        set since the socket can't be used for another request.
+
         :return: the number of bytes left on the socket (may be None)
         """
         pending = None
         if not self.isclosed():
             # Make sure nothing was left to be read on the socket
-            pending = 0
-            data = True
-            while data and self.length:
-                # read() will update self.length
-                data = self.read(min(self.length, self._discarded_buf_size))
-                pending += len(data)
+            try:
+                pending = self._discard_body()
+            except http.client.IncompleteRead:
+                drained = False
+            else:
+                # Responses to HEAD requests and empty bodies (204, 304,
+                # Content-Length: 0) have nothing to read. Otherwise the body
+                # may have no known end (it's then delimited by the server
+                # closing the connection) or be truncated.
+                drained = (self._method == 'HEAD' or self.length == 0
+                           or (self.isclosed() and not self.length))
             if pending:
                 trace.mutter("%s bytes left on the HTTP socket", pending)
+            if not drained:
+                self.will_close = True
             self.close()
         return pending
 
@@ -250,7 +327,7 @@ class AbstractHTTPConnection:
         netloc = '{}:{}'.format(self.host, self.port)
         if self.proxied_host is not None:
             netloc += '(proxy for %s)' % self.proxied_host
-        trace.mutter('* About to connect() to %s' % netloc)
+        trace.mutter('* About to connect() to %s', netloc)
 
     def getresponse(self):
         """Capture the response to be able to cleanup"""
@@ -281,6 +358,11 @@ class AbstractHTTPConnection:
                         or e.args[0] not in (errno.ECONNRESET, errno.ECONNABORTED)):
                     raise
                 self.close()
+            else:
+                if self._response.will_close:
+                    # Don't let the next request read from a socket where
+                    # the end of this response is unknown
+                    self.close()
             self._response = None
         # Preserve our preciousss
         sock = self.sock
@@ -409,6 +491,37 @@ class Request(urllib.request.Request):
         self.auth = {}
         self.proxy_auth = {}
         self.proxied_host = None
+        # Lazily computed by merged_headers()
+        self._merged_headers = None
+
+    def add_header(self, key, val):
+        urllib.request.Request.add_header(self, key, val)
+        self._merged_headers = None
+
+    def add_unredirected_header(self, key, val):
+        urllib.request.Request.add_unredirected_header(self, key, val)
+        self._merged_headers = None
+
+    def remove_header(self, header_name):
+        urllib.request.Request.remove_header(self, header_name)
+        self._merged_headers = None
+
+    def merged_headers(self):
+        """Get all the headers to send for this request.
+
+        The unredirected headers take precedence over the regular ones. The
+        result is cached until the headers are modified and should not be
+        mutated by callers.
+        """
+        if self._merged_headers is None:
+            # Some servers or proxies will choke on headers not properly
+            # cased. http.client/urllib/urllib.request all use capitalize to
+            # get canonical header names, so we use title() to fix them just
+            # before sending the request.
+            self._merged_headers = {
+                name.title(): val for name, val in itertools.chain(
+                    self.headers.items(), self.unredirected_hdrs.items())}
+        return self._merged_headers
 
     def get_method(self):
         return self.method
@@ -481,9 +594,98 @@ class ConnectionHandler(urllib.request.BaseHandler):
 
     handler_order = 1000  # after all pre-processings
 
+    # The maximum number of idle connections kept around
+    max_keepalive = 20
+    # Idle connections older than that (in seconds) are not reused
+    keepalive_timeout = 30
+
     def __init__(self, report_activity=None, ca_certs=None):
         self._report_activity = report_activity
         self.ca_certs = ca_certs
+        # Connections already established, in least recently used order,
+        # values are (connection, last_used) tuples.
+        self._pool = collections.OrderedDict()
+
+    def get_key(self, request):
+        """The key identifying the connections that can serve request.
+
+        Default ports are made explicit so that http://host/ and
+        http://host:80/ share their connections.
+        """
+        host, port = splitport(request.host)
+        if port is None:
+            if request.type == 'https':
+                port = HTTPSConnection.default_port
+            else:
+                port = HTTPConnection.default_port
+        return (request.type, host.lower(), int(port), request.proxied_host)
+
+    def _is_reusable(self, connection):
+        """Check that an idle connection can be used for a new request."""
+        sock = connection.sock
+        if sock is None:
+            # Not connected yet (or closed), http.client will (re)connect
+            return True
+        if isinstance(getattr(sock, 'sock', sock), ssl.SSLSocket):
+            # ssl sockets can be readable while idle (session tickets for
+            # example), we rely on do_open retrying on a bad response.
+            return True
+        try:
+            readable, _, _ = select.select([sock], [], [], 0)
+        except (OSError, ValueError):
+            return False
+        # Nothing should be available on an idle connection, if something is,
+        # the server closed it (or is talking garbage).
+        return not readable
+
+    def _in_use(self, connection):
+        """Is a response still being read from connection?"""
+        response = connection._response
+        return response is not None and not response.isclosed()
+
+    def _discard(self, connection):
+        if not self._in_use(connection):
+            connection.close()
+        # Otherwise someone is still reading a response, the connection will
+        # be closed by its owner
+
+    def _purge(self, now):
+        """Discard the connections not used for too long."""
+        while self._pool:
+            key, (connection, last_used) = next(iter(self._pool.items()))
+            if now - last_used <= self.keepalive_timeout:
+                break
+            del self._pool[key]
+            self._discard(connection)
+
+    def _get_pooled_connection(self, key):
+        try:
+            connection, last_used = self._pool[key]
+        except KeyError:
+            return None
+        if self._in_use(connection):
+            # The connection is checked out: another transport (or a clone
+            # sharing it) is still reading a response from it, leave it to
+            # them rather than draining that response.
+            return None
+        del self._pool[key]
+        if time.time() - last_used > self.keepalive_timeout:
+            self._discard(connection)
+            return None
+        connection.cleanup_pipe()
+        if not self._is_reusable(connection):
+            connection.close()
+            return None
+        return connection
+
+    def _remember_connection(self, key, connection):
+        now = time.time()
+        self._pool[key] = (connection, now)
+        self._pool.move_to_end(key)
+        self._purge(now)
+        while len(self._pool) > self.max_keepalive:
+            _, (evicted, _) = self._pool.popitem(last=False)
+            self._discard(evicted)
 
     def create_connection(self, request, http_connection_class):
         host = request.host
@@ -510,7 +712,8 @@ class ConnectionHandler(urllib.request.BaseHandler):
         """Capture or inject the request connection.
 
         Two cases:
-        - the request have no connection: create a new one,
+        - the request have no connection: reuse an idle one for the same
+          host if any or create a new one,
 
         - the request have a connection: this one have been used
           already, let's capture it, so that we can give it to
@@ -519,11 +722,15 @@ class ConnectionHandler(urllib.request.BaseHandler):
           a first request and then propagate it, from request to
           request or to cloned transports.
         """
+        key = self.get_key(request)
         connection = request.connection
+        if connection is None:
+            connection = self._get_pooled_connection(key)
         if connection is None:
             # Create a new one
             connection = self.create_connection(request, http_connection_class)
-            request.connection = connection
+        request.connection = connection
+        self._remember_connection(key, connection)
 
         # All connections will pass here, propagate debug level
         connection.set_debuglevel(DEBUG)
@@ -559,13 +766,15 @@ class AbstractHTTPHandler(urllib.request.AbstractHTTPHandler):
 
     def __init__(self):
         urllib.request.AbstractHTTPHandler.__init__(self, debuglevel=DEBUG)
+        self._default_header_items = tuple(self._default_headers.items())
 
     def http_request(self, request):
         """Common headers setting"""
 
-        for name, value in self._default_headers.items():
-            if name not in request.headers:
-                request.headers[name] = value
+        headers = request.headers
+        for name, value in self._default_header_items:
+            if name not in headers:
+                headers[name] = value
         # FIXME: We may have to add the Content-Length header if
         # we have data to send.
         return request
@@ -591,6 +800,12 @@ class AbstractHTTPHandler(urllib.request.AbstractHTTPHandler):
             raise errors.ConnectionError("Couldn't resolve host '%s'"
                                          % origin_req_host,
                                          orig_error=exc_val)
+        elif exc_type is ConnectionRefusedError:
+            # Nobody is listening, retrying will not help either
+            raise errors.ConnectionError(
+                msg='while sending {} {}:'.format(request.get_method(),
+                                                  request.selector),
+                orig_error=exc_val)
         elif isinstance(exc_val, http.client.ImproperConnectionState):
             # The http.client pipeline is in incorrect state, it's a bug in our
             # implementation.
@@ -659,16 +874,7 @@ class AbstractHTTPHandler(urllib.request.AbstractHTTPHandler):
                 'Cannot process a request without a connection')
 
         # Get all the headers
-        headers = {}
-        headers.update(request.header_items())
-        headers.update(request.unredirected_hdrs)
-        # Some servers or proxies will choke on headers not properly
-        # cased. http.client/urllib/urllib.request all use capitalize to get canonical
-        # header names, but only python2.5 urllib.request use title() to fix them just
-        # before sending the request. And not all versions of python 2.5 do
-        # that. Since we replace urllib.request.AbstractHTTPHandler.do_open we do it
-        # ourself below.
-        headers = {name.title(): val for name, val in headers.items()}
+        headers = request.merged_headers()
 
         try:
             method = request.get_method()
@@ -693,14 +899,12 @@ class AbstractHTTPHandler(urllib.request.AbstractHTTPHandler):
                 print('Request sent: [%r] from (%s)'
                       % (request, request.connection.sock.getsockname()))
             response = connection.getresponse()
-            convert_to_addinfourl = True
         except (ssl.SSLError, ssl.CertificateError):
             # Something is wrong with either the certificate or the hostname,
             # re-trying won't help
             raise
         except (socket.gaierror, http.client.BadStatusLine, http.client.UnknownProtocol, OSError, http.client.HTTPException):
             response = self.retry_or_raise(http_class, request, first_try)
-            convert_to_addinfourl = False
 
         response.msg = response.reason
         return response
@@ -717,42 +921,6 @@ class AbstractHTTPHandler(urllib.request.AbstractHTTPHandler):
 #            connection.send(body)
 #            response = connection.getresponse()
 
-        if self._debuglevel >= 2:
-            print('Receives response: %r' % response)
-            print('  For: {!r}({!r})'.format(request.get_method(),
-                                     request.get_full_url()))
-
-        if convert_to_addinfourl:
-            # Shamelessly copied from urllib.request
-            req = request
-            r = response
-            r.recv = r.read
-            fp = socket._fileobject(r, bufsize=65536)
-            resp = urllib.request.addinfourl(fp, r.msg, req.get_full_url())
-            resp.code = r.status
-            resp.msg = r.reason
-            resp.version = r.version
-            if self._debuglevel >= 2:
-                print('Create addinfourl: %r' % resp)
-                print('  For: {!r}({!r})'.format(request.get_method(),
-                                         request.get_full_url()))
-            if 'http' in debug.debug_flags:
-                version = 'HTTP/%d.%d'
-                try:
-                    version = version % (resp.version / 10,
-                                         resp.version % 10)
-                except:
-                    version = 'HTTP/%r' % resp.version
-                trace.mutter('< {} {} {}'.format(version, resp.code,
-                                             resp.msg))
-                # Use the raw header lines instead of treating resp.info() as a
-                # dict since we may miss duplicated headers otherwise.
-                hdrs = [h.rstrip('\r\n') for h in resp.info().headers]
-                trace.mutter('< ' + '\n< '.join(hdrs) + '\n')
-        else:
-            resp = response
-        return resp
-
 
 class HTTPHandler(AbstractHTTPHandler):
     """A custom handler that just thunks into HTTPConnection"""
@@ -847,7 +1015,7 @@ class HTTPRedirectHandler(urllib.request.HTTPRedirectHandler):
 
         origin_req_host = req.origin_req_host
 
-        if code in (301, 302, 303, 307, 308):
+        if code in _redirection_codes:
             return Request(req.get_method(), newurl,
                            headers=req.headers,
                            origin_req_host=origin_req_host,
@@ -899,16 +1067,17 @@ class HTTPRedirectHandler(urllib.request.HTTPRedirectHandler):
                                                newurl)
 
         # loop detection
-        # .redirect_dict has a key url if url was previously visited.
-        if hasattr(req, 'redirect_dict'):
-            visited = redirected_req.redirect_dict = req.redirect_dict
-            if (visited.get(newurl, 0) >= self.max_repeats or
-                    len(visited) >= self.max_redirections):
-                raise urllib.request.HTTPError(req.get_full_url(), code,
-                                               self.inf_msg + msg, headers, fp)
-        else:
-            visited = redirected_req.redirect_dict = req.redirect_dict = {}
-        visited[newurl] = visited.get(newurl, 0) + 1
+        # .redirect_dict counts the visits of each url in the redirect chain,
+        # it is shared by all the requests of the chain.
+        visited = getattr(req, 'redirect_dict', None)
+        if visited is None:
+            visited = req.redirect_dict = collections.Counter()
+        elif (visited[newurl] >= self.max_repeats or
+                len(visited) >= self.max_redirections):
+            raise urllib.request.HTTPError(req.get_full_url(), code,
+                                           self.inf_msg + msg, headers, fp)
+        redirected_req.redirect_dict = visited
+        visited[newurl] += 1
 
         # We can close the fp now that we are sure that we won't
         # use it with HTTPError.
@@ -1658,23 +1827,23 @@ class HTTPErrorProcessor(urllib.request.HTTPErrorProcessor):
     instead, we leave our Transport handle them.
     """
 
-    accepted_errors = [200,  # Ok
-                       201,
-                       202,
-                       204,
-                       206,  # Partial content
-                       207,  # Multi-Status Response (for webdav)
-                       400,
-                       403,
-                       404,  # Not found
-                       405,  # Method not allowed
-                       406,  # Not Acceptable
-                       409,  # Conflict
-                       412,  # Precondition failed (for webdav)
-                       416,  # Range not satisfiable
-                       422,  # Unprocessible entity
-                       501,  # Not implemented
-                       ]
+    accepted_errors = frozenset([200,  # Ok
+                                 201,
+                                 202,
+                                 204,
+                                 206,  # Partial content
+                                 207,  # Multi-Status Response (for webdav)
+                                 400,
+                                 403,
+                                 404,  # Not found
+                                 405,  # Method not allowed
+                                 406,  # Not Acceptable
+                                 409,  # Conflict
+                                 412,  # Precondition failed (for webdav)
+                                 416,  # Range not satisfiable
+                                 422,  # Unprocessible entity
+                                 501,  # Not implemented
+                                 ])
     """The error codes the caller will handle.
 
     This can be specialized in the request on a case-by case basis, but the
@@ -1744,6 +1913,60 @@ class Opener:
             pprint.pprint(self._opener.__dict__)
 
 
+class Urllib3LikeResponse:
+    """Wrap an urllib response with the urllib3 response interface."""
+
+    def __init__(self, actual):
+        self._actual = actual
+        self._data = None
+
+    def getheader(self, name, default=None):
+        if self._actual.headers is None:
+            raise http.client.ResponseNotReady()
+        return self._actual.headers.get(name, default)
+
+    def getheaders(self):
+        if self._actual.headers is None:
+            raise http.client.ResponseNotReady()
+        return list(self._actual.headers.items())
+
+    @property
+    def status(self):
+        return self._actual.code
+
+    @property
+    def reason(self):
+        return self._actual.reason
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._data = self._actual.read()
+        return self._data
+
+    @property
+    def text(self):
+        if self.status == 204:
+            return None
+        charset = cgi.parse_header(
+            self._actual.headers['Content-Type'])[1].get('charset')
+        if charset:
+            return self.data.decode(charset)
+        else:
+            return self.data.decode()
+
+    def read(self, amt=None):
+        if amt is None and 'evil' in debug.debug_flags:
+            mutter_callsite(4, "reading full response.")
+        return self._actual.read(amt)
+
+    def readlines(self):
+        return self._actual.readlines()
+
+    def readline(self, size=-1):
+        return self._actual.readline(size)
+
+
 class HttpTransport(ConnectedTransport):
     """HTTP Client implementations.
 
@@ -1831,7 +2054,7 @@ class HttpTransport(ConnectedTransport):
 
         code = response.code
         if (request.follow_redirections is False
-                and code in (301, 302, 303, 307, 308)):
+                and code in _redirection_codes):
             raise errors.RedirectRequested(request.get_full_url(),
                                            request.redirected_to,
                                            is_permanent=(code in (301, 308)))
@@ -1840,58 +2063,6 @@ class HttpTransport(ConnectedTransport):
             trace.mutter('redirected from: {} to: {}'.format(request.get_full_url(),
                                                          request.redirected_to))
 
-        class Urllib3LikeResponse:
-
-            def __init__(self, actual):
-                self._actual = actual
-                self._data = None
-
-            def getheader(self, name, default=None):
-                if self._actual.headers is None:
-                    raise http.client.ResponseNotReady()
-                return self._actual.headers.get(name, default)
-
-            def getheaders(self):
-                if self._actual.headers is None:
-                    raise http.client.ResponseNotReady()
-                return list(self._actual.headers.items())
-
-            @property
-            def status(self):
-                return self._actual.code
-
-            @property
-            def reason(self):
-                return self._actual.reason
-
-            @property
-            def data(self):
-                if self._data is None:
-                    self._data = self._actual.read()
-                return self._data
-
-            @property
-            def text(self):
-                if self.status == 204:
-                    return None
-                charset = cgi.parse_header(
-                    self._actual.headers['Content-Type'])[1].get('charset')
-                if charset:
-                    return self.data.decode(charset)
-                else:
-                    return self.data.decode()
-
-            def read(self, amt=None):
-                if amt is None and 'evil' in debug.debug_flags:
-                    mutter_callsite(4, "reading full response.")
-                return self._actual.read(amt)
-
-            def readlines(self):
-                return self._actual.readlines()
-
-            def readline(self, size=-1):
-                return self._actual.readline(size)
-
         return Urllib3LikeResponse(response)
 
     def disconnect(self):
@@ -1903,12 +2074,7 @@ class HttpTransport(ConnectedTransport):
         """Does the target location exist?
         """
         response = self._head(relpath)
-
-        code = response.status
-        if code == 200:  # "ok",
-            return True
-        else:
-            return False
+        return response.status == 200  # "ok"
 
     def get(self, relpath):
         """Get the file at the given relative path.
@@ -1930,6 +2096,7 @@ class HttpTransport(ConnectedTransport):
         """
         abspath = self._remote_path(relpath)
         headers = {}
+        accept_gzip = False
         if offsets or tail_amount:
             range_header = self._attempted_range_header(offsets, tail_amount)
             if range_header is not None:
@@ -1937,31 +2104,44 @@ class HttpTransport(ConnectedTransport):
                 headers = {'Range': bytes}
         else:
             range_header = None
+            # Whole files can travel compressed. Ranges can't: their offsets
+            # would refer to the compressed representation.
+            headers = {'Accept-Encoding': 'gzip'}
+            accept_gzip = True
 
         response = self.request('GET', abspath, headers=headers)
 
-        if response.status == 404:  # not found
-            raise NoSuchFile(abspath)
-        elif response.status == 416:
-            # We don't know which, but one of the ranges we specified was
-            # wrong.
-            raise errors.InvalidHttpRange(abspath, range_header,
-                                          'Server return code %d' % response.status)
-        elif response.status == 400:
-            if range_header:
+        code = response.status
+        # Check for success first, the error cases are rare.
+        if code not in (200, 206):
+            if code == 404:  # not found
+                raise NoSuchFile(abspath)
+            elif code == 416:
                 # We don't know which, but one of the ranges we specified was
                 # wrong.
-                raise errors.InvalidHttpRange(
-                    abspath, range_header,
-                    'Server return code %d' % response.status)
+                raise errors.InvalidHttpRange(abspath, range_header,
+                                              'Server return code %d' % code)
+            elif code == 400:
+                if range_header:
+                    # We don't know which, but one of the ranges we specified
+                    # was wrong.
+                    raise errors.InvalidHttpRange(
+                        abspath, range_header,
+                        'Server return code %d' % code)
+                else:
+                    raise errors.BadHttpRequest(abspath, response.reason)
             else:
-                raise errors.BadHttpRequest(abspath, response.reason)
-        elif response.status not in (200, 206):
-            raise errors.UnexpectedHttpStatus(abspath, response.status, headers=response.getheaders())
-
-        data = handle_response(
-            abspath, response.status, response.getheader, response)
-        return response.status, data
+                raise errors.UnexpectedHttpStatus(
+                    abspath, code, headers=response.getheaders())
+
+        body = response
+        content_encoding = response.getheader('content-encoding', '')
+        # Only trust the encoding if we asked for it, some servers wrongly
+        # label .gz files as gzip encoded.
+        if accept_gzip and content_encoding.strip().lower() == 'gzip':
+            body = gzip.GzipFile(fileobj=response, mode='rb')
+        data = handle_response(abspath, code, response.getheader, body)
+        return code, data
 
     def _remote_path(self, relpath):
         """See ConnectedTransport._remote_path.
@@ -1995,10 +2175,10 @@ class HttpTransport(ConnectedTransport):
     def _degrade_range_hint(self, relpath, ranges):
         if self._range_hint == 'multi':
             self._range_hint = 'single'
-            mutter('Retry "%s" with single range request' % relpath)
+            mutter('Retry "%s" with single range request', relpath)
         elif self._range_hint == 'single':
             self._range_hint = None
-            mutter('Retry "%s" without ranges' % relpath)
+            mutter('Retry "%s" without ranges', relpath)
         else:
             # We tried all the tricks, but nothing worked, caller must reraise.
             return False
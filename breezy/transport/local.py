@@ -20,6 +20,7 @@ This is a fairly thin wrapper on regular file IO.
 """
 
 import errno
+import io
 import os
 from stat import ST_MODE, S_ISDIR, S_IMODE
 import sys
@@ -151,6 +152,16 @@ class LocalTransport(transport.Transport):
                 return transport.LateReadError(relpath)
             self._translate_error(e, path)
 
+    if getattr(os, 'pread', None) is not None:
+        def _read_at(self, fp, offset, length):
+            # A positioned read is a single syscall and leaves the file
+            # position alone, unlike seek() followed by read().
+            try:
+                fileno = fp.fileno()
+            except (AttributeError, io.UnsupportedOperation):
+                return super()._read_at(fp, offset, length)
+            return os.pread(fileno, length, offset)
+
     def put_file(self, relpath, f, mode=None):
         """Copy the file-like object into the location.
 
@@ -96,6 +96,9 @@ class WorkingTree(mutabletree.MutableTree, ControlComponent):
 
     branch: "Branch"
 
+    # Whether the filesystem of the tree supports symlinks, looked up once
+    _supports_symlinks: Optional[bool] = None
+
     # override this to set the strategy for storing views
     def _make_views(self):
         return views.DisabledViews(self)
@@ -136,7 +139,9 @@ class WorkingTree(mutabletree.MutableTree, ControlComponent):
         return self._transport
 
     def supports_symlinks(self):
-        return osutils.supports_symlinks(self.basedir)
+        if self._supports_symlinks is None:
+            self._supports_symlinks = osutils.supports_symlinks(self.basedir)
+        return self._supports_symlinks
 
     def is_control_filename(self, filename):
         """True if filename is the name of a control file in this tree.